@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Avatar selection by emotion.
+
+Each avatar directory has an index, emotions.txt, which gives every face
+its emotion vector: how angry, happy, suspicious and shouting the face is,
+each from 0 to 1. A line has the filename of a face and the four numbers,
+separated by whitespace. Blank lines and lines starting with "#" are
+skipped.
+
+A panel gets the face whose vector is nearest to the vector of its
+Analyze scores (see emotion_vector()). When several faces are equally
+near, the hash of the nick and the lines of the panel picks one of them,
+so the same panel always gets the same face.
+
+Distances are computed for many panels at once with NumPy if it is
+installed, and in pure Python otherwise. Both give the same faces.
+"""
+import os
+import codecs
+import hashlib
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+DIMENSIONS = "angry", "happy", "suspicious", "shout"
+
+INDEX_FILENAME = "emotions.txt"
+
+# Distances closer than this are a tie, so rounding never decides a face.
+TIE = 1e-9
+
+
+def emotion_vector(angry, happy, suspicious, shout):
+	"""Scales the scores of an Analyze into an emotion vector. Two keyword
+	hits make a panel fully angry or happy, two suspicious keywords (which
+	score 2 each) make it fully suspicious, and a shout ratio of 1 makes it
+	fully shouting."""
+	return (min(angry, 2) / 2.0, min(happy, 2) / 2.0,
+	        min(suspicious, 4.0) / 4.0, min(shout, 1.0))
+
+
+def read_index(path):
+	"""Reads the index of the avatar directory ``path``, and returns a list
+	of (filename, vector) pairs in the order of the index."""
+	faces = []
+	with codecs.open(os.path.join(path, INDEX_FILENAME), encoding="utf-8") as file:
+		for line in file:
+			line = line.strip()
+			if not line or line.startswith(u"#"):
+				continue
+			fields = line.split()
+			if len(fields) != 1 + len(DIMENSIONS):
+				raise ValueError("invalid index line: " + repr(line))
+			faces.append((fields[0], tuple(float(value) for value in fields[1:])))
+	return faces
+
+
+def panel_hash(nick, lines):
+	"""The hash of a panel, which breaks ties between faces."""
+	digest = hashlib.md5(nick.encode("utf-8"))
+	for line in lines:
+		digest.update("\0")
+		digest.update(line.encode("utf-8"))
+	return int(digest.hexdigest()[:8], 16)
+
+
+class AvatarIndex(object):
+	"""The faces of an avatar directory and their emotion vectors."""
+
+	__slots__ = "path", "filenames", "vectors", "_matrix"
+
+	def __init__(self, path):
+		self.path = path
+		faces = read_index(path)
+		if not faces:
+			raise ValueError("no faces in " + repr(path))
+		self.filenames = [filename for filename, vector in faces]
+		self.vectors = [vector for filename, vector in faces]
+		if numpy is None:
+			self._matrix = None
+		else:
+			self._matrix = numpy.array(self.vectors, dtype=float)
+
+	def _distances(self, vectors):
+		"""The squared distances of each of ``vectors`` to every face."""
+		if self._matrix is not None:
+			points = numpy.array(vectors, dtype=float).reshape(len(vectors), len(DIMENSIONS))
+			differences = points[:, numpy.newaxis, :] - self._matrix[numpy.newaxis, :, :]
+			return (differences * differences).sum(axis=2).tolist()
+		faces = self.vectors
+		return [[sum((a - b) * (a - b) for a, b in zip(vector, face)) for face in faces]
+		        for vector in vectors]
+
+	def choose_many(self, vectors, panels):
+		"""Chooses the faces of many panels at once.
+
+		``vectors`` are emotion vectors, and ``panels`` are (nick, lines)
+		pairs in the same order. Returns the filenames of the faces."""
+		filenames = self.filenames
+		# Scores are mostly small counts, so many panels have the same
+		# vector, and its nearest faces are found once.
+		indices = {}
+		for vector in vectors:
+			indices.setdefault(tuple(vector), len(indices))
+		unique = sorted(indices, key=indices.__getitem__)
+		nearest_faces = []
+		for distances in self._distances(unique):
+			nearest = min(distances) + TIE
+			nearest_faces.append([i for i, distance in enumerate(distances) if distance <= nearest])
+		chosen = []
+		for vector, (nick, lines) in zip(vectors, panels):
+			ties = nearest_faces[indices[tuple(vector)]]
+			if len(ties) == 1:
+				chosen.append(filenames[ties[0]])
+			else:
+				chosen.append(filenames[ties[panel_hash(nick, lines) % len(ties)]])
+		return chosen
+
+	def choose(self, vector, nick, lines):
+		"""Chooses the face of a panel."""
+		return self.choose_many([vector], [(nick, lines)])[0]
+
+	def __len__(self):
+		return len(self.filenames)
@@ -1,7 +1,14 @@
 """:mod:`irclog.archive` --- IRC log archive
 ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-.. todo:: File encoding auto-detection.
+.. data:: COMPACTED_SUFFIX
+
+   The suffix of compacted log files. See :mod:`irclog.compact`.
+
+.. data:: ENCODING_SAMPLE_SIZE
+
+   The number of bytes :func:`detect_encoding()` reads from the head of a
+   file to guess its encoding.
 
 .. data:: STRPTIME_TO_GLOB
 
@@ -21,15 +28,34 @@
       '[0-9][0-9][0-9][0-9]-[01][0-9]-[0-3][0-9]'
 
 """
+import os
 import re
-import glob
+import time
+import heapq
+import bisect
 import functools
 import datetime
+import collections
 try:
     import cStringIO as StringIO
 except ImportError:
     import StringIO
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+import chardet
+import irclog.codec
+import irclog.columnar
 import irclog.parser
+import irclog.search
 
 
 STRPTIME_TO_GLOB = {"%a": "???",
@@ -85,6 +111,46 @@ STRPTIME_TO_PATTERN = {"%a": "[Mm]on|[Tt]u[eu]|[Ww]ed|[Ff]ri|[Ss](?:at|un)",
                        "%Z": ".*?",
                        "%%": "%"}
 STRPTIME_DIRECTIVE_PATTERN = re.compile("|".join(STRPTIME_TO_GLOB.iterkeys()))
+ENCODING_SAMPLE_SIZE = 16 * 1024
+COMPACTED_SUFFIX = ".ircm"
+
+_encoding_cache = {}
+
+
+def detect_encoding(path, sample_size=ENCODING_SAMPLE_SIZE):
+    """Guesses the text encoding of a log file from its first
+    ``sample_size`` bytes. It is UTF-8 if the sample is valid UTF-8, or
+    :func:`chardet.detect()` guesses it otherwise. Results are cached by
+    the path and its modification time.
+
+    :param path: a path of log file
+    :type path: :class:`basestring`
+    :param sample_size: the number of bytes to read
+    :type sample_size: :class:`int`
+    :returns: an encoding name
+
+    """
+    mtime = os.path.getmtime(path)
+    try:
+        cached_mtime, encoding = _encoding_cache[path]
+    except KeyError:
+        pass
+    else:
+        if cached_mtime == mtime:
+            return encoding
+    with open(path, "rb") as file:
+        sample = file.read(sample_size)
+    if len(sample) == sample_size and "\n" in sample:
+        # Do not let a character cut in half at the end spoil the guess.
+        sample = sample[:sample.rindex("\n")]
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError:
+        encoding = chardet.detect(sample).get("encoding") or "utf-8"
+    else:
+        encoding = "utf-8"
+    _encoding_cache[path] = mtime, encoding
+    return encoding
 
 
 class FilenamePattern(object):
@@ -100,6 +166,11 @@ class FilenamePattern(object):
        >>> pattern.glob_pattern_string(server="Freenode")
        '/logs/Freenode/*.[0-9][0-9][0-9][0-9]-[01][0-9]-[0-3][0-9].log'
 
+    The pattern is split into replacers once, when it is made. Compiled
+    :mod:`re` patterns are cached for each set of bound replacers, so
+    :meth:`re_pattern()` and :meth:`parse_path()` compile nothing for the
+    sets recently used.
+
     .. data:: REPLACER_PATTERN
 
        The pattern of replacer e.g. ``<date:%Y-%m-%d>``, ``<channel>``.
@@ -109,16 +180,48 @@ class FilenamePattern(object):
           name: /[A-Za-z_]+/
           format: /[^>]*/
 
+    .. data:: MATCHER_CACHE_SIZE
+
+       The number of compiled :mod:`re` patterns to keep. The least
+       recently used one is dropped first.
+
     """
 
     REPLACER_PATTERN = re.compile(r"<(?P<name>[A-Za-z_]+)"
                                   r"(?::(?P<format>[^>]*))?>")
+    MATCHER_CACHE_SIZE = 64
 
-    __slots__ = "pattern", "_re_pattern"
+    __slots__ = ("pattern", "_tokens", "_tail", "_pairs", "_glob_defaults",
+                 "_re_defaults", "_matchers", "_levels")
 
     def __init__(self, pattern):
         self.pattern = pattern
-        self._re_pattern = None
+        tokens = []
+        pos = 0
+        for m in self.REPLACER_PATTERN.finditer(pattern):
+            tokens.append((pattern[pos:m.start()], m.group("name"),
+                           m.group("format") or None))
+            pos = m.end()
+        self._tokens = tuple(tokens)
+        self._tail = pattern[pos:]
+        self._pairs = tuple((name, form) for _, name, form in tokens)
+        def replace(m):
+            return "(?:" + STRPTIME_TO_PATTERN[m.group(0)] + ")"
+        self._glob_defaults = {}
+        self._re_defaults = {}
+        for name, form in self._pairs:
+            if form:
+                self._glob_defaults[name] = STRPTIME_DIRECTIVE_PATTERN.sub(
+                    lambda m: STRPTIME_TO_GLOB[m.group(0)],
+                    form
+                )
+                val = STRPTIME_DIRECTIVE_PATTERN.sub(replace, form)
+                self._re_defaults[name] = "(?P<{0}>{1})".format(name, val)
+            else:
+                self._glob_defaults[name] = "*"
+                self._re_defaults[name] = "(?P<{0}>.+?)".format(name)
+        self._matchers = collections.OrderedDict()
+        self._levels = None
 
     @property
     def replacers(self):
@@ -132,8 +235,8 @@ class FilenamePattern(object):
            ['server', 'channel', 'date']
 
         """
-        for m in self.REPLACER_PATTERN.finditer(self.pattern):
-            yield m.group("name")
+        for name, _ in self._pairs:
+            yield name
 
     @property
     def replacer_pairs(self):
@@ -148,8 +251,7 @@ class FilenamePattern(object):
            [('server', None), ('channel', None), ('date', '%Y-%m-%d')]
 
         """
-        for m in self.REPLACER_PATTERN.finditer(self.pattern):
-            yield m.group("name"), m.group("format") or None
+        return self._pairs
 
     @property
     def replacer_dict(self):
@@ -170,6 +272,75 @@ class FilenamePattern(object):
         """
         return dict(self.replacer_pairs)
 
+    def path_components(self):
+        """Splits the pattern into path components on :data:`os.sep`. A
+        separator in the format of a replacer does not split it, so such a
+        component spans several levels of directories.
+
+        .. sourcecode:: pycon
+
+           >>> pattern = FilenamePattern("/logs/<server>/<channel>"
+           ...                           "/<date:%Y/%m-%d>.log")
+           >>> pattern.path_components()
+           ['', 'logs', '<server>', '<channel>', '<date:%Y/%m-%d>.log']
+
+        :returns: a :class:`list` of path components
+
+        """
+        components = [""]
+        pos = 0
+        for m in self.REPLACER_PATTERN.finditer(self.pattern):
+            literals = self.pattern[pos:m.start()].split(os.sep)
+            components[-1] += literals[0]
+            components.extend(literals[1:])
+            components[-1] += m.group(0)
+            pos = m.end()
+        literals = self.pattern[pos:].split(os.sep)
+        components[-1] += literals[0]
+        components.extend(literals[1:])
+        return components
+
+    def levels(self):
+        """Splits the pattern into the directory its literal head names and
+        the levels of directories under it. Each level is a tuple of the
+        path component (see :meth:`path_components()`) it is in, how many
+        levels of the component are above it, whether it may match hidden
+        names, and whether it is the last level of the component. A
+        component is matched at its last level against the names of all of
+        its levels.
+
+        .. sourcecode:: pycon
+
+           >>> pattern = FilenamePattern("/logs/<server>/<date:%Y/%m-%d>.log")
+           >>> root, levels = pattern.levels()
+           >>> root
+           '/logs'
+           >>> for component, span, hidden, final in levels:
+           ...     print component, span, hidden, final
+           <server> 0 False True
+           <date:%Y/%m-%d>.log 0 False False
+           <date:%Y/%m-%d>.log 1 False True
+
+        :returns: a pair of ``(root, levels)``
+
+        """
+        if self._levels is None:
+            parts = self.path_components()
+            root = []
+            while (len(parts) > 1 and
+                   not self.REPLACER_PATTERN.search(parts[0])):
+                root.append(parts.pop(0))
+            root = os.sep.join(root) if root != [""] else os.sep
+            levels = []
+            for part in parts:
+                component = FilenamePattern(part)
+                segments = part.split(os.sep)
+                for span, segment in enumerate(segments):
+                    levels.append((component, span, segment[:1] == ".",
+                                   span == len(segments) - 1))
+            self._levels = root, tuple(levels)
+        return self._levels
+
     def fill_replacers(self, replacers, escape=None):
         """Fills replacers with given values.
 
@@ -211,19 +382,15 @@ class FilenamePattern(object):
         """
         if not isinstance(replacers, dict):
             replacers = dict(replacers)
-        pos = 0
         buffer = StringIO.StringIO()
-        matches = self.REPLACER_PATTERN.finditer(self.pattern)
-        for m in matches:
-            if pos < m.start():
-                part = self.pattern[pos:m.start()]
+        for part, name, form in self._tokens:
+            if part:
                 buffer.write(escape(part) if escape else part)
-            pos = m.end()
-            value = replacers[m.group("name")]
-            if m.group("format") and not isinstance(value, basestring):
-                value = format(value, m.group("format"))
+            value = replacers[name]
+            if form and not isinstance(value, basestring):
+                value = format(value, form)
             buffer.write(value)
-        part = self.pattern[pos:]
+        part = self._tail
         buffer.write(escape(part) if escape else part)
         return buffer.getvalue()
 
@@ -250,46 +417,69 @@ class FilenamePattern(object):
         :returns: a glob pattern string
 
         """
-        for name, form in self.replacer_pairs:
-            if name not in replacers:
-                if form:
-                    replacers[name] = STRPTIME_DIRECTIVE_PATTERN.sub(
-                        lambda m: STRPTIME_TO_GLOB[m.group(0)],
-                        form
-                    )
-                else:
-                    replacers[name] = "*"
+        for name, default in self._glob_defaults.iteritems():
+            replacers.setdefault(name, default)
         return self.fill_replacers(replacers)
 
     def glob(self, **replacers):
-        """Globs with the pattern.
+        """Globs with the pattern. See :meth:`iglob()`.
 
         :param \*\*replacers: replacers to fill. keywords go replacer names and
                               values fills them
         :returns: a :class:`list` of all matched paths
 
-        .. seealso::
-
-           - Module :mod:`glob`
-           - Function :func:`glob.glob()`
-
         """
-        return glob.glob(self.glob_pattern_string(**replacers))
+        return list(self.iglob(**replacers))
 
     def iglob(self, **replacers):
-        """Case-insensitive version of :meth:`glob()`.
+        """Lazy version of :meth:`glob()`. It walks the levels of
+        directories the pattern describes (see :meth:`levels()`): a path
+        component whose replacers are all filled is joined to the path as it
+        is, and only the directories of the other components are listed
+        (see :func:`match_directory()`), each once. Paths are yielded as they
+        are found, so taking only the first one lists as few directories as
+        possible. :class:`ArchiveIndex` walks the same levels with the same
+        function.
 
         :param \*\*replacers: replacers to fill. keywords go replacer names and
                               values fills them
-        :returns: a :class:`list` of all matched paths
-        
-        .. seealso::
+        :returns: matched paths
 
-           - Module :mod:`glob`
-           - Function :func:`glob.iglob()`
+        .. note:: This is exactly a generator function.
 
         """
-        return glob.glob(self.glob_pattern_string(**replacers))
+        root, levels = self.levels()
+        stack = [(root, 0)]
+        while stack:
+            dirpath, depth = stack.pop()
+            component, span, hidden, final = levels[depth]
+            bound = dict((name, replacers[name])
+                         for name in component.replacers if name in replacers)
+            if not span and len(bound) == len(component.replacer_pairs):
+                path = os.path.join(dirpath,
+                                    component.fill_replacers(bound))
+                while not levels[depth][3]:
+                    depth += 1
+                if depth < len(levels) - 1:
+                    stack.append((path, depth + 1))
+                elif os.path.lexists(path):
+                    yield path
+                continue
+            last = depth == len(levels) - 1
+            regex = component.re_pattern(**bound) if final else None
+            try:
+                names = match_directory(dirpath, regex, hidden, span,
+                                        dirs_only=not last)
+            except OSError:
+                continue
+            prefix = os.path.join(dirpath, "")
+            if last:
+                for name, _ in names:
+                    yield prefix + name
+                continue
+            # Walk in the order of entries, as glob.glob() does.
+            stack.extend((prefix + name, depth + 1)
+                         for name, _ in reversed(names))
 
     def re_pattern_string(self, **replacers):
         r"""Generates a :mod:`re` pattern string. It takes keyword arguments of
@@ -302,21 +492,27 @@ class FilenamePattern(object):
            >>> pattern.re_pattern_string(date=datetime.date(2010, 8, 4))
            '^\\/(?P<server>.+?)\\/(?P<channel>.+?)\\.20100804$'
 
+        Values of replacers are matched literally:
+
+        .. sourcecode:: pycon
+
+           >>> pattern.re_pattern_string(channel="#c++",
+           ...                           date=datetime.date(2010, 8, 4))
+           '^\\/(?P<server>.+?)\\/\\#c\\+\\+\\.20100804$'
+
         :param \*\*replacers: replacers to fill. keywords go replacer names and
                               values fills them
         :returns: a :mod:`re` pattern string
 
         """
-        def replace(m):
-            return "(?:" + STRPTIME_TO_PATTERN[m.group(0)] + ")"
-        for name, form in self.replacer_pairs:
-            if name not in replacers:
-                if form:
-                    val = STRPTIME_DIRECTIVE_PATTERN.sub(replace, form)
-                    val = "(?P<{0}>{1})".format(name, val)
-                else:
-                    val = "(?P<{0}>.+?)".format(name)
-                replacers[name] = val
+        forms = dict(self._pairs)
+        for name, value in replacers.items():
+            form = forms.get(name)
+            if form and not isinstance(value, basestring):
+                value = format(value, form)
+            replacers[name] = re.escape(value)
+        for name, default in self._re_defaults.iteritems():
+            replacers.setdefault(name, default)
         return "^" + self.fill_replacers(replacers, escape=re.escape) + "$"
 
     def re_pattern(self, **replacers):
@@ -333,10 +529,47 @@ class FilenamePattern(object):
 
                re.compile(file_pattern.re_pattern_string(**replacers))
 
+           except that compiled patterns are cached for each set of
+           ``replacers``.
+
+        """
+        try:
+            key = frozenset(replacers.iteritems())
+            matcher = self._matchers.pop(key)
+        except TypeError:
+            # Unhashable values cannot be cached.
+            return re.compile(self.re_pattern_string(**replacers))
+        except KeyError:
+            matcher = re.compile(self.re_pattern_string(**replacers))
+            while len(self._matchers) >= self.MATCHER_CACHE_SIZE:
+                self._matchers.popitem(last=False)
+        self._matchers[key] = matcher
+        return matcher
+
+    def parse_path(self, path, **replacers):
+        """Pulls the values of all replacers out of ``path`` at once.
+
+        .. sourcecode:: pycon
+
+           >>> pattern = FilenamePattern("/logs/<server>"
+           ...                           "/<channel>.<date:%Y-%m-%d>.log")
+           >>> values = pattern.parse_path(
+           ...     "/logs/Freenode/#hongminhee.2010-08-04.log"
+           ... )
+           >>> values["server"], values["channel"], values["date"]
+           ('Freenode', '#hongminhee', '2010-08-04')
+           >>> pattern.parse_path("/logs/Freenode/README")
+
+        :param path: a path to parse
+        :type path: :class:`basestring`
+        :param \*\*replacers: replacers already known. keywords go replacer
+                              names and values fills them
+        :returns: a :class:`dict` of the values of replacers which are not
+                  given, or ``None`` if ``path`` does not match the pattern
+
         """
-        if not self._re_pattern:
-            self._re_pattern = re.compile(self.re_pattern_string(**replacers))
-        return self._re_pattern
+        match = self.re_pattern(**replacers).match(path)
+        return match.groupdict() if match else None
 
     def __str__(self):
         return self.pattern
@@ -347,6 +580,351 @@ class FilenamePattern(object):
         return "{0}{1}({2!r})".format(mod, t.__name__, self.pattern)
 
 
+def list_directory(path):
+    """Lists entries in a directory with the way to tell if each is a
+    directory. It uses :func:`os.scandir()` or the :mod:`scandir` package if
+    available, which know it without :func:`os.stat()` on most file systems,
+    and falls back to :func:`os.listdir()`.
+
+    :param path: a directory path
+    :type path: :class:`basestring`
+    :returns: a :class:`list` of ``(name, is_dir)`` pairs, where
+              ``is_dir`` is a function which takes no arguments
+
+    """
+    if scandir is not None:
+        return [(entry.name, entry.is_dir) for entry in scandir(path)]
+    return [(name, functools.partial(_is_dir, path, name))
+            for name in os.listdir(path)]
+
+
+def _is_dir(path, name):
+    return os.path.isdir(os.path.join(path, name))
+
+
+def match_directory(path, regex, hidden, span=0, dirs_only=False):
+    """Lists names in a directory which match a level of a pattern (see
+    :meth:`FilenamePattern.levels()`). Names which start with ``.`` are
+    matched only by levels which start with ``.``, as :mod:`glob` does.
+
+    :param path: a directory path
+    :type path: :class:`basestring`
+    :param regex: the :mod:`re` pattern of the component the level is in,
+                  or ``None`` for a level which is not the last of its
+                  component, where any directory matches
+    :param hidden: whether names which start with ``.`` may match
+    :type hidden: :class:`bool`
+    :param span: how many levels of the component are above. the names of
+                 as many directories above ``path`` are matched with ``regex``
+                 as well
+    :type span: :class:`int`
+    :param dirs_only: matches only directories
+    :type dirs_only: :class:`bool`
+    :returns: a :class:`list` of ``(name, match)`` pairs in the order of
+              entries, where ``match`` is ``None`` if ``regex`` is ``None``
+
+    """
+    if span:
+        head = os.sep.join(path.split(os.sep)[-span:]) + os.sep
+    else:
+        head = ""
+    names = []
+    for name, is_dir in list_directory(path or os.curdir):
+        if name[:1] == "." and not hidden:
+            continue
+        match = None
+        if regex is not None:
+            match = regex.match(head + name)
+            if not match:
+                continue
+        if (dirs_only or regex is None) and not is_dir():
+            continue
+        names.append((name, match))
+    return names
+
+
+def _intern(string):
+    return intern(string) if type(string) is str else string
+
+
+class ArchiveIndex(object):
+    """The index of log files in an archive, which maps servers to channels
+    to date keys to file paths. It is built by walking the directories
+    ``pattern`` describes, and then refreshed incrementally: only
+    directories whose modification times have changed are listed again.
+
+    .. sourcecode:: pycon
+
+       >>> index = ArchiveIndex("/logs/<server>/<channel>.<date:%Y-%m-%d>.log")
+       >>> index.keys("Freenode")  # doctest: +SKIP
+       ['#hongminhee', '#langdev']
+       >>> index.keys("Freenode", "#hongminhee")  # doctest: +SKIP
+       ['2010-08-03', '2010-08-04']
+
+    A replacer whose format has separators, e.g. ``<date:%Y/%m-%d>``, spans
+    as many levels of directories:
+
+    .. sourcecode:: pycon
+
+       >>> import shutil, tempfile
+       >>> root = tempfile.mkdtemp()
+       >>> os.makedirs(os.path.join(root, "srv", "#chan", "2010"))
+       >>> for name in "08-03.log", "08-04.log":
+       ...     open(os.path.join(root, "srv", "#chan", "2010", name), "w").close()
+       >>> index = ArchiveIndex(root + "/<server>/<channel>/<date:%Y/%m-%d>.log")
+       >>> index.keys()
+       ['srv']
+       >>> index.keys("srv", "#chan")
+       ['2010/08-03', '2010/08-04']
+
+    A directory whose modification time has changed is listed again, but
+    the index changes only if the names which match the pattern do:
+
+    .. sourcecode:: pycon
+
+       >>> open(os.path.join(root, "srv", "#chan", "2010", "README"), "w").close()
+       >>> index.refresh(force=True)
+       False
+       >>> open(os.path.join(root, "srv", "#chan", "2010", "08-05.log"), "w").close()
+       >>> index.refresh(force=True)
+       True
+       >>> index.keys("srv", "#chan")
+       ['2010/08-03', '2010/08-04', '2010/08-05']
+       >>> shutil.rmtree(root)
+
+    :param pattern: logs filename pattern
+    :type pattern: :class:`FilenamePattern`, :class:`basestring`
+    :param path: a path of the file to save the index into. the index is
+                 loaded from it if it exists. default is ``None`` which
+                 means to keep the index only in memory
+    :type path: :class:`basestring`
+    :param refresh_interval: seconds for which directories are not checked
+                             again after they have been checked
+    :type refresh_interval: :class:`float`
+
+    .. data:: LEVELS
+
+       The replacer names of the levels of the index.
+
+    .. data:: VERSION
+
+       The version of the saved file format.
+
+    """
+
+    LEVELS = "server", "channel", "date"
+    VERSION = 1
+    REFRESH_INTERVAL = 1.0
+
+    __slots__ = ("pattern", "path", "refresh_interval", "root", "levels",
+                 "directories", "tree", "refreshed_at", "_memo")
+
+    def __init__(self, pattern, path=None, refresh_interval=REFRESH_INTERVAL):
+        if not isinstance(pattern, FilenamePattern):
+            pattern = FilenamePattern(pattern)
+        self.pattern = pattern
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.root, self.levels = pattern.levels()
+        self.directories = {}
+        self.tree = {}
+        self.refreshed_at = None
+        self._memo = {}
+        if path is not None and os.path.isfile(path):
+            self.load()
+
+    def _list(self, dirpath, depth, values):
+        """Lists names in ``dirpath`` which match the level ``depth`` of the
+        pattern with :func:`match_directory()`, with values of
+        :data:`LEVELS` for them.
+
+        """
+        component, span, hidden, final = self.levels[depth]
+        last = depth == len(self.levels) - 1
+        regex = component.re_pattern() if final else None
+        entries = {}
+        for name, match in match_directory(dirpath, regex, hidden, span,
+                                           dirs_only=not last):
+            if match is None:
+                # A level within a component which spans several levels.
+                entries[name] = values
+                continue
+            groups = match.groupdict()
+            entries[name] = tuple(_intern(groups[level]) if level in groups
+                                  else value
+                                  for level, value in zip(self.LEVELS, values))
+        return entries
+
+    def _add(self, path, values):
+        if None in values:
+            return
+        server, channel, date = values
+        dates = self.tree.setdefault(server, {}).setdefault(channel, {})
+        if date not in dates or path < dates[date]:
+            dates[date] = path
+
+    def _remove(self, path, values):
+        if None in values:
+            return
+        server, channel, date = values
+        channels = self.tree.get(server, {})
+        dates = channels.get(channel, {})
+        if dates.get(date) == path:
+            del dates[date]
+            if not dates:
+                del channels[channel]
+                if not channels:
+                    del self.tree[server]
+
+    def refresh(self, force=False):
+        """Checks directories, and lists again only ones that have changed
+        since the last time. Unless ``force`` is ``True``, it does nothing
+        for :attr:`refresh_interval` seconds after the last check.
+
+        :param force: checks even if it has been checked just before
+        :type force: :class:`bool`
+        :returns: ``True`` if the index has changed
+
+        """
+        now = time.time()
+        if (not force and self.refreshed_at is not None and
+            now - self.refreshed_at < self.refresh_interval):
+            return False
+        last = len(self.levels) - 1
+        changed = False
+        reached = set()
+        stack = [(self.root, 0, (None,) * len(self.LEVELS))]
+        while stack:
+            dirpath, depth, values = stack.pop()
+            try:
+                mtime = os.stat(dirpath or os.curdir).st_mtime
+            except OSError:
+                continue
+            reached.add(dirpath)
+            record = self.directories.get(dirpath)
+            if record is None or record[0] != mtime:
+                entries = self._list(dirpath, depth, values)
+                old_entries = record[2] if record else None
+                if entries != old_entries:
+                    if depth == last:
+                        old_entries = old_entries or {}
+                        for name, entry_values in old_entries.iteritems():
+                            if entries.get(name) != entry_values:
+                                self._remove(os.path.join(dirpath, name),
+                                             entry_values)
+                        for name, entry_values in entries.iteritems():
+                            if old_entries.get(name) != entry_values:
+                                self._add(os.path.join(dirpath, name),
+                                          entry_values)
+                    changed = True
+                if now - mtime < 1:
+                    # It may change again within the resolution of mtime,
+                    # so it is not trusted until it gets older.
+                    mtime = None
+                # Only the mtime may have changed, e.g. by a file which is
+                # not a log, and then the index is not saved again for it.
+                self.directories[dirpath] = mtime, depth, entries
+            else:
+                entries = record[2]
+            if depth < last:
+                for name, entry_values in entries.iteritems():
+                    stack.append((os.path.join(dirpath, name), depth + 1,
+                                  entry_values))
+        for dirpath in set(self.directories) - reached:
+            _, depth, entries = self.directories.pop(dirpath)
+            if depth == last:
+                for name, entry_values in entries.iteritems():
+                    self._remove(os.path.join(dirpath, name), entry_values)
+            changed = True
+        self.refreshed_at = now
+        if changed:
+            self._memo.clear()
+            if self.path is not None:
+                self.save()
+        return changed
+
+    def node(self, *keys):
+        """Finds the node of the tree ``keys`` lead to. The node of a server
+        is a :class:`dict` of its channels, and the node of a channel is
+        a :class:`dict` of paths by date keys.
+
+        :param \*keys: a server name, and then a channel name
+        :returns: a :class:`dict`, or ``None`` if there is no such node
+
+        """
+        self.refresh()
+        node = self.tree
+        for key in keys:
+            node = node.get(key)
+            if node is None:
+                return None
+        return node
+
+    def keys(self, *keys):
+        """The sorted keys of the node ``keys`` lead to.
+
+        :param \*keys: a server name, and then a channel name
+        :returns: a sorted :class:`list` of keys
+
+        """
+        def sorted_keys():
+            node = self.node(*keys)
+            return [] if node is None else sorted(node)
+        return self.memoize(("keys",) + keys, sorted_keys)
+
+    def memoize(self, key, function):
+        """Returns the value ``function`` returns, which is cached by ``key``
+        until the index changes.
+
+        :param key: a hashable key of the value
+        :param function: a function that makes the value
+        :type function: callable object
+        :returns: the value
+
+        """
+        self.refresh()
+        try:
+            return self._memo[key]
+        except KeyError:
+            value = self._memo[key] = function()
+            return value
+
+    def load(self):
+        """Loads the index from :attr:`path`. It is ignored if it was saved
+        for another pattern or in another format version.
+
+        """
+        with open(self.path, "rb") as file:
+            try:
+                data = pickle.load(file)
+            except (EOFError, pickle.UnpicklingError):
+                return
+        if (data.get("version") == self.VERSION and
+            data.get("pattern") == str(self.pattern)):
+            self.directories = data["directories"]
+            self.tree = data["tree"]
+            self._memo.clear()
+
+    def save(self):
+        """Saves the index into :attr:`path`. It is written into a temporary
+        file first, and then renamed to :attr:`path`, so readers never see
+        a half-written index.
+
+        """
+        data = {"version": self.VERSION, "pattern": str(self.pattern),
+                "directories": self.directories, "tree": self.tree}
+        temp_path = "{0}.{1}.tmp".format(self.path, os.getpid())
+        with open(temp_path, "wb") as file:
+            pickle.dump(data, file, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_path, self.path)
+
+    def __repr__(self):
+        t = type(self)
+        mod = "" if t.__module__ == "__main__" else t.__module__ + "."
+        return "{0}{1}({2!r}, {3!r})".format(mod, t.__name__,
+                                             str(self.pattern), self.path)
+
+
 class BaseArchive(object):
     """Abstract base class for :class:`Archive`, :class:`Server` and
     :class:`Channel`.
@@ -363,25 +941,19 @@ class BaseArchive(object):
 
        Should be implemented in the subclass.
 
+    .. attribute:: index_keys
+
+       The keys of the node of :class:`ArchiveIndex` for the elements.
+       Should be implemented in the subclass.
+
     """
 
     pattern_replacers = {}
+    index_keys = ()
 
     def __iter__(self):
-        regex = self.pattern.re_pattern(**self.pattern_replacers)
-        files = self.pattern.glob(**self.pattern_replacers)
-        files.sort()
-        elements = []
-        for path in files:
-            match = regex.match(path)
-            if match:
-                try:
-                    el = self.decode_element_key(match.group(self.ELEMENT_TAG))
-                except IndexError:
-                    continue
-                if el not in elements:
-                    elements.append(el)
-                    yield self.ELEMENT_CLASS(self, el)
+        for key in self.archive.index.keys(*self.index_keys):
+            yield self.ELEMENT_CLASS(self, self.decode_element_key(key))
 
     def decode_element_key(self, element_key):
         """Decodes an element key string to element key.
@@ -406,10 +978,8 @@ class BaseArchive(object):
         return str(element_key)
 
     def __contains__(self, element):
-        replacers = dict(self.pattern_replacers)
-        replacers[self.ELEMENT_TAG] = self.encode_element_key(element)
-        paths = self.pattern.glob(**replacers)
-        return bool(paths)
+        node = self.archive.index.node(*self.index_keys)
+        return node is not None and self.encode_element_key(element) in node
 
     def __getitem__(self, element):
         if element in self:
@@ -417,10 +987,8 @@ class BaseArchive(object):
         raise KeyError(element)
 
     def __len__(self):
-        cnt = 0
-        for _ in self:
-            cnt += 1
-        return cnt
+        node = self.archive.index.node(*self.index_keys)
+        return 0 if node is None else len(node)
 
 
 class Archive(BaseArchive):
@@ -429,18 +997,155 @@ class Archive(BaseArchive):
     :param pattern: logs filename pattern
                     e.g. ``"/logs/<server>/<channel>.<date:%Y-%m-%d>.log"``
     :type pattern: :class:`FilenamePattern`, :class:`basestring`
+    :param encoding: the text encoding of logs. default is ``None`` which
+                     means to detect it for each file
+                     (see :func:`detect_encoding()`)
+    :type encoding: :class:`basestring`
+    :param encodings: text encodings of logs by channel names. these take
+                      precedence over ``encoding``
+    :type encodings: :class:`dict`
+    :param index_path: a path of the file to save the index of log files
+                       into. default is ``None`` which means to keep it only
+                       in memory
+    :type index_path: :class:`basestring`
+    :param search_index_path: a directory of the full-text search index.
+                              default is ``None`` which means not to have
+                              the index
+    :type search_index_path: :class:`basestring`
+    :param cache: a cache of parsed logs. default is ``None`` which means
+                  to parse logs every time
+    :type cache: :class:`irclog.cache.LogCache`
+    :param compacted_root: the root directory of the mirror tree of
+                           compacted log files. default is ``None`` which
+                           means they are next to raw log files
+    :type compacted_root: :class:`basestring`
+
+
+    .. attribute:: encoding
+
+       The text encoding of logs, or ``None`` to detect it for each file.
+
+    .. attribute:: encodings
+
+       The :class:`dict` of text encodings of logs by channel names.
+
+    .. attribute:: index
+
+       The :class:`ArchiveIndex` of log files.
+
+    .. attribute:: search_index
+
+       The :class:`irclog.search.SearchIndex`, or ``None``.
+
+    .. attribute:: cache
+
+       The :class:`irclog.cache.LogCache`, or ``None``.
+
+    .. attribute:: interns
+
+       The :class:`dict` of nicks and channels shared by all messages
+       parsed from the archive. See :func:`irclog.parser.tokens()` and
+       :meth:`intern_table()`.
+
+    .. attribute:: compacted_root
+
+       The root directory of the mirror tree of compacted log files, or
+       ``None`` if they are next to raw log files.
+
+    .. data:: INTERNS_LIMIT
+
+       The number of identifiers :attr:`interns` may have. It is emptied
+       when it has more.
 
     """
 
     ELEMENT_CLASS = lambda *a, **k: Server(*a, **k)
     ELEMENT_TAG = "server"
+    INTERNS_LIMIT = 100000
 
-    __slots__ = "pattern",
+    __slots__ = ("pattern", "encoding", "encodings", "index", "search_index",
+                 "cache", "interns", "compacted_root")
 
-    def __init__(self, pattern):
+    def __init__(self, pattern, encoding=None, encodings=None,
+                 index_path=None, search_index_path=None, cache=None,
+                 compacted_root=None):
         if not isinstance(pattern, FilenamePattern):
             pattern = FilenamePattern(pattern)
         self.pattern = pattern
+        self.encoding = encoding
+        self.encodings = dict(encodings or {})
+        self.index = ArchiveIndex(pattern, index_path)
+        if search_index_path is None:
+            self.search_index = None
+        else:
+            self.search_index = irclog.search.SearchIndex(search_index_path)
+        self.cache = cache
+        self.interns = {}
+        self.compacted_root = compacted_root
+
+    @property
+    def archive(self):
+        return self
+
+    def intern_table(self):
+        """Returns :attr:`interns` to parse messages with. It is emptied
+        first when it has more than :data:`INTERNS_LIMIT` identifiers, so
+        it does not grow without bound. Messages parsed before keep sharing
+        what they have.
+
+        :returns: :attr:`interns`
+
+        """
+        if len(self.interns) > self.INTERNS_LIMIT:
+            self.interns.clear()
+        return self.interns
+
+    def compacted_path(self, path):
+        """The path of the compacted file of a raw log file. It is the raw
+        path with :data:`COMPACTED_SUFFIX`, moved into :attr:`compacted_root`
+        if it is set.
+
+        :param path: a path of raw log file
+        :type path: :class:`basestring`
+        :returns: a path of compacted file
+
+        """
+        if self.compacted_root is not None:
+            path = os.path.join(self.compacted_root,
+                                os.path.relpath(path, self.index.root))
+        return path + COMPACTED_SUFFIX
+
+    def search(self, query):
+        """Finds messages which contain all terms of ``query`` in all
+        channels. See :meth:`Channel.search()`.
+
+        :param query: terms to find
+        :type query: :class:`unicode`
+        :returns: pairs of ``(log, message)``
+
+        """
+        for server in self:
+            for channel in server:
+                for pair in channel.search(query):
+                    yield pair
+
+    def last_seen(self, nick):
+        """Finds the last message ``nick`` has made in all channels. See
+        :meth:`Channel.last_seen()`.
+
+        :param nick: a nick
+        :type nick: :class:`unicode`
+        :returns: a pair of ``(log, message)``, or ``None``
+
+        """
+        last = None
+        for server in self:
+            for channel in server:
+                pair = channel.last_seen(nick)
+                if pair and (last is None or
+                             pair[1].messaged_at > last[1].messaged_at):
+                    last = pair
+        return last
 
     def __repr__(self):
         t = type(self)
@@ -477,6 +1182,10 @@ class Server(BaseArchive):
         replacers["server"] = self.server
         return replacers
 
+    @property
+    def index_keys(self):
+        return self.server,
+
     def __eq__(self, other):
         return self.archive == other.archive and self.server == other.server
 
@@ -526,6 +1235,19 @@ class Channel(BaseArchive):
         replacers["channel"] = self.channel
         return replacers
 
+    @property
+    def index_keys(self):
+        return self.server.server, self.channel
+
+    @property
+    def encoding(self):
+        """The text encoding of the channel's logs, or ``None`` to detect it
+        for each file.
+
+        """
+        archive = self.archive
+        return archive.encodings.get(self.channel, archive.encoding)
+
     def decode_element_key(self, element_key):
         """Decodes an element key string to element key.
 
@@ -550,8 +1272,189 @@ class Channel(BaseArchive):
                             "not " + repr(element_key))
         return super(Channel, self).encode_element_key(element_key)
 
+    @property
+    def dates(self):
+        """The sorted :class:`list` of :class:`datetime.date` the channel has
+        logged. It should not be modified.
+
+        """
+        index = self.archive.index
+        keys = self.index_keys
+        def dates():
+            return sorted(self.decode_element_key(key)
+                          for key in index.keys(*keys))
+        return index.memoize(("dates",) + keys, dates)
+
+    def logs_between(self, start, end):
+        """The logs from ``start`` to ``end``, both inclusive, in order.
+
+        :param start: the first date
+        :type start: :class:`datetime.date`
+        :param end: the last date
+        :type end: :class:`datetime.date`
+        :returns: a :class:`list` of :class:`Log`
+
+        """
+        dates = self.dates
+        left = bisect.bisect_left(dates, start)
+        right = bisect.bisect_right(dates, end)
+        return [Log(self, date) for date in dates[left:right]]
+
+    def latest(self, n=1):
+        """The last ``n`` logs, in order.
+
+        :param n: the number of logs
+        :type n: :class:`int`
+        :returns: a :class:`list` of :class:`Log`
+
+        """
+        dates = self.dates
+        return [Log(self, date) for date in dates[max(len(dates) - n, 0):]]
+
+    def previous_log(self, date):
+        """The last log before ``date``.
+
+        :param date: a date
+        :type date: :class:`datetime.date`
+        :returns: a :class:`Log`, or ``None`` if there is no log before
+
+        """
+        dates = self.dates
+        i = bisect.bisect_left(dates, date)
+        return Log(self, dates[i - 1]) if i else None
+
+    def next_log(self, date):
+        """The first log after ``date``.
+
+        :param date: a date
+        :type date: :class:`datetime.date`
+        :returns: a :class:`Log`, or ``None`` if there is no log after
+
+        """
+        dates = self.dates
+        i = bisect.bisect_right(dates, date)
+        return Log(self, dates[i]) if i < len(dates) else None
+
+    @property
+    def search_index(self):
+        """The :attr:`Archive.search_index`. Queries only read it, so logs
+        have to be indexed by
+        :meth:`irclog.search.SearchIndex.update_channel()` beforehand,
+        e.g. by :mod:`irclog.compact` with ``--search-index``.
+
+        """
+        index = self.archive.search_index
+        if index is None:
+            raise ValueError(repr(self.archive) + " has no search index")
+        return index
+
+    def messages_at(self, pairs):
+        """Parses the lines at ``(date_ordinal, offset)`` pairs.
+
+        :param pairs: ``(date_ordinal, offset)`` pairs
+        :type pairs: iterable object
+        :returns: pairs of ``(log, message)`` in order
+
+        .. note:: This is exactly a generator function.
+
+        """
+        offsets = {}
+        for ordinal, offset in pairs:
+            offsets.setdefault(ordinal, []).append(offset)
+        for ordinal in sorted(offsets):
+            log = Log(self, datetime.date.fromordinal(ordinal))
+            for _, message in log.messages_at(sorted(offsets[ordinal])):
+                if message is not None:
+                    yield log, message
+
+    def search(self, query):
+        """Finds messages which contain all terms of ``query``, using
+        :attr:`search_index`.
+
+        :param query: terms to find
+        :type query: :class:`unicode`
+        :returns: pairs of ``(log, message)`` in order
+
+        """
+        return self.messages_at(self.search_index.search(self, query))
+
+    def nick_history(self, nick):
+        """Finds messages ``nick`` has made, using :attr:`search_index`.
+        See :func:`irclog.search.message_nicks()`.
+
+        :param nick: a nick
+        :type nick: :class:`unicode`
+        :returns: pairs of ``(log, message)`` in order
+
+        """
+        return self.messages_at(self.search_index.nick_history(self, nick))
+
+    def last_seen(self, nick):
+        r"""Finds the last message ``nick`` has made. It is one of the
+        messages :meth:`nick_history()` finds, so unsetting the topic does
+        not count but parting does:
+
+        .. sourcecode:: pycon
+
+           >>> import shutil, tempfile
+           >>> root = tempfile.mkdtemp()
+           >>> os.makedirs(os.path.join(root, "logs", "srv"))
+           >>> def write(name, data):
+           ...     path = os.path.join(root, "logs", "srv", name)
+           ...     with open(path, "w") as file:
+           ...         file.write(data)
+           >>> write("#a.2010-08-03.log",
+           ...       "10:00 <hong> hi\n"
+           ...       "10:01 -!- hong [~hong@example.com] has left #a [bye/]\n")
+           >>> write("#a.2010-08-04.log",
+           ...       "09:00 <DrSlem> hmmm\n"
+           ...       "09:30 -!- Topic unset by hong on #a\n")
+           >>> write("#b.2010-08-04.log", "08:00 <Hong> morning\n")
+           >>> archive = Archive(root + "/logs/<server>/<channel>"
+           ...                   ".<date:%Y-%m-%d>.log", encoding="utf-8",
+           ...                   search_index_path=os.path.join(root, "index"))
+           >>> archive.search_index.update_archive(archive)
+           4
+           >>> log, message = archive["srv"]["#a"].last_seen(u"HONG")
+           >>> log.date, type(message).__name__
+           (datetime.date(2010, 8, 3), 'PartMessage')
+           >>> [(log.date, message.line) for log, message
+           ...  in archive["srv"]["#a"].nick_history(u"DrSlem")]
+           [(datetime.date(2010, 8, 4), u'hmmm')]
+           >>> print archive["srv"]["#a"].last_seen(u"nobody")
+           None
+
+        :meth:`Archive.last_seen()` takes the latest of all channels:
+
+        .. sourcecode:: pycon
+
+           >>> log, message = archive.last_seen(u"hong")
+           >>> print log.channel, log.date, message.line
+           #b 2010-08-04 morning
+           >>> archive.search_index.close()
+           >>> shutil.rmtree(root)
+
+        :param nick: a nick
+        :type nick: :class:`unicode`
+        :returns: a pair of ``(log, message)``, or ``None``
+
+        """
+        history = self.search_index.nick_history(self, nick)
+        for pair in self.messages_at(history[-1:]):
+            return pair
+
+    @property
+    def date_set(self):
+        """The :class:`frozenset` of :class:`datetime.date` the channel has
+        logged, for checking if a date is logged with a hash lookup.
+
+        """
+        index = self.archive.index
+        return index.memoize(("date_set",) + self.index_keys,
+                             lambda: frozenset(self.dates))
+
     def __contains__(self, date):
-        return True
+        return isinstance(date, datetime.date) and date in self.date_set
 
     def __eq__(self, other):
         return self.server == other.server and self.channel == other.channel
@@ -590,11 +1493,12 @@ class Log(object):
 
     """
 
-    __slots__ = "channel", "date"
+    __slots__ = "channel", "date", "_path"
 
     def __init__(self, channel, date):
         self.channel = channel
         self.date = date
+        self._path = None
 
     @property
     def server(self):
@@ -613,13 +1517,72 @@ class Log(object):
 
     @property
     def yesterday_log(self):
-        """The yesterday log of the same channel."""
-        return self.channel[self.date - datetime.timedelta(days=1)]
+        """The yesterday log of the same channel. ``None`` if the channel
+        has not logged yesterday.
+
+        """
+        date = self.date - datetime.timedelta(days=1)
+        return Log(self.channel, date) if date in self.channel else None
 
     @property
     def tomorrow_log(self):
-        """The tomorrow log of the same channel."""
-        return self.channel[self.date + datetime.timedelta(days=1)]
+        """The tomorrow log of the same channel. ``None`` if the channel
+        has not logged tomorrow.
+
+        """
+        date = self.date + datetime.timedelta(days=1)
+        return Log(self.channel, date) if date in self.channel else None
+
+    @property
+    def previous_log(self):
+        """The last log of the same channel before the day. ``None`` if there
+        is no log before.
+
+        """
+        return self.channel.previous_log(self.date)
+
+    @property
+    def next_log(self):
+        """The first log of the same channel after the day. ``None`` if there
+        is no log after.
+
+        """
+        return self.channel.next_log(self.date)
+
+    @property
+    def path(self):
+        """The path of the log file. ``None`` if the channel of the day has
+        not logged.
+
+        It is looked up in the :class:`ArchiveIndex` first, and the pattern
+        is walked only for a file the index does not know. A found path is
+        kept by the log, so it is resolved once for a log.
+
+        """
+        if self._path is None:
+            channel = self.channel
+            key = channel.encode_element_key(self.date)
+            node = self.archive.index.node(*channel.index_keys)
+            path = node.get(key) if node else None
+            if path is None:
+                replacers = dict(channel.pattern_replacers)
+                replacers["date"] = key
+                path = next(self.pattern.iglob(**replacers), None)
+            self._path = path
+        return self._path
+
+    @property
+    def encoding(self):
+        """The text encoding of the log file. If it is not set for the
+        channel, it is detected from the file.
+
+        """
+        encoding = self.channel.encoding
+        if encoding is None:
+            path = self.path
+            if path is not None:
+                encoding = detect_encoding(path)
+        return encoding or "utf-8"
 
     def is_logged(self):
         """Returns ``True`` if the channel of the day has logged.
@@ -627,10 +1590,79 @@ class Log(object):
         :returns: ``True`` or ``False``
 
         """
-        replacers = dict(self.channel.pattern_replacers)
-        replacers["date"] = self.channel.encode_element_key(self.date)
-        files = self.pattern.glob(**replacers)
-        return bool(files)
+        return self.path is not None
+
+    def tail(self, offset=0):
+        """Makes a :class:`LogTail` which follows the log file from
+        ``offset``.
+
+        :param offset: the byte offset to start from. default is the start
+                       of the file
+        :type offset: :class:`int`
+        :returns: a :class:`LogTail`
+
+        """
+        return LogTail(self, offset)
+
+    def messages_at(self, offsets):
+        """Parses the lines which start at ``offsets`` of the log file.
+
+        :param offsets: byte offsets of lines
+        :type offsets: iterable object
+        :returns: pairs of ``(offset, message)``. ``message`` is ``None``
+                  if the line has no message
+
+        .. note:: This is exactly a generator function.
+
+        """
+        path = self.path
+        if path is None:
+            return
+        encoding = self.channel.encoding or detect_encoding(path)
+        with open(path, "rb") as file:
+            for offset in offsets:
+                file.seek(offset)
+                line = file.readline()
+                yield offset, irclog.parser.parse_line(line, self.date,
+                                                       encoding)
+
+    def message_at(self, offset):
+        """Parses the line which starts at ``offset`` of the log file.
+
+        :param offset: a byte offset of the line
+        :type offset: :class:`int`
+        :returns: a :class:`irclog.messages.BaseMessage` instance, or
+                  ``None`` if the line has no message
+
+        """
+        for _, message in self.messages_at((offset,)):
+            return message
+
+    def batch(self, batch=None):
+        """Parses the log file into a :class:`irclog.columnar.MessageBatch`,
+        which takes much less memory than message objects. Logs of many days
+        can be appended to one batch:
+
+        .. sourcecode:: python
+
+           batch = None
+           for log in channel.logs_between(first_day, last_day):
+               batch = log.batch(batch)
+
+        :param batch: a batch to append messages to. default is a new one
+        :type batch: :class:`irclog.columnar.MessageBatch`
+        :returns: the batch
+
+        """
+        if batch is None:
+            batch = irclog.columnar.MessageBatch()
+        path = self.path
+        if path is None:
+            return batch
+        encoding = self.channel.encoding or detect_encoding(path)
+        with open(path, "rb") as file:
+            lines = irclog.parser.read_lines(file, encoding)
+            return irclog.parser.parse_batch(lines, self.date, encoding, batch)
 
     def __eq__(self, other):
         return self.channel == other.channel and self.date == other.date
@@ -638,16 +1670,74 @@ class Log(object):
     def __ne__(self, other):
         return not (self == other)
 
-    def __iter__(self):
-        replacers = dict(self.channel.pattern_replacers)
-        replacers["date"] = self.channel.encode_element_key(self.date)
-        files = self.pattern.glob(**replacers)
-        if not files:
+    @property
+    def compacted_path(self):
+        """The path of the compacted file of the log. ``None`` if the
+        channel of the day has not logged. The file may not exist yet.
+
+        """
+        path = self.path
+        return None if path is None else self.archive.compacted_path(path)
+
+    def messages(self, kinds=None, nicks=None):
+        """Iterates messages of the log which are of ``kinds`` and made by
+        ``nicks``. When the log is parsed from the raw file, the filters are
+        given to the parser, which skips lines it does not need without
+        decoding them (see :func:`irclog.parser.tokens()`). Messages from a
+        compacted file or the cache are filtered after they are read.
+
+        :param kinds: message types to take. default is ``None`` which means
+                      all types
+        :type kinds: :class:`type`, :class:`tuple`
+        :param nicks: nicks whose messages to take, case-insensitively.
+                      default is ``None`` which means all nicks
+        :type nicks: iterable object
+        :returns: :class:`irclog.messages.BaseMessage` instances
+
+        .. note:: This is exactly a generator function.
+
+        """
+        path = self.path
+        if path is None:
             return
-        with open(files[0]) as file:
-            for msg in irclog.parser.parse(file, self.date):
+        if nicks is not None:
+            nicks = frozenset(nick.lower() for nick in nicks)
+        # A compacted file is taken only if it has been made after the last
+        # change of the raw file.
+        compacted = self.archive.compacted_path(path)
+        try:
+            if os.path.getmtime(compacted) > os.path.getmtime(path):
+                with open(compacted, "rb") as file:
+                    messages = irclog.codec.EncodedMessages(file.read())
+            else:
+                messages = None
+        except (OSError, IOError, ValueError):
+            messages = None
+        interns = self.archive.intern_table()
+        cache = self.archive.cache
+        if messages is None and cache is not None:
+            def parse():
+                return self._parse(path, interns)
+            messages = cache.messages(path, parse, interns)
+        if messages is None:
+            messages = self._parse(path, interns, kinds, nicks)
+        elif kinds is not None or nicks is not None:
+            messages = (msg for msg in messages
+                        if _accepts(msg, kinds, nicks))
+        for msg in messages:
+            yield msg
+
+    def _parse(self, path, interns, kinds=None, nicks=None):
+        encoding = self.channel.encoding or detect_encoding(path)
+        with open(path, "rb") as file:
+            lines = irclog.parser.read_lines(file, encoding)
+            for msg in irclog.parser.parse(lines, self.date, encoding,
+                                           interns, kinds, nicks):
                 yield msg
 
+    def __iter__(self):
+        return self.messages()
+
     def __repr__(self):
         t = type(self)
         mod = "" if t.__module__ == "__main__" else t.__module__ + "."
@@ -655,6 +1745,307 @@ class Log(object):
         return "{0}({1!r}, {2!r})".format(clsname, self.channel, self.date)
 
 
+class LogTail(object):
+    """Follows a log file which is still being written, e.g. the log of
+    today. It remembers the byte offset it has read to, and each
+    :meth:`poll()` parses only lines appended after it.
+
+    .. sourcecode:: python
+
+       tail = channel.latest()[0].tail()
+       for message in tail.follow(interval=0.5):
+           print message.messaged_at
+
+    :param log: a log to follow
+    :type log: :class:`Log`
+    :param offset: the byte offset to start from
+    :type offset: :class:`int`
+
+
+    .. attribute:: log
+
+       The log it follows.
+
+    .. attribute:: offset
+
+       The byte offset it has read to. It is always at the start of a line.
+
+    """
+
+    __slots__ = "log", "offset", "path", "encoding", "_inode"
+
+    def __init__(self, log, offset=0):
+        self.log = log
+        self.offset = offset
+        self.path = None
+        self.encoding = None
+        self._inode = None
+
+    def poll(self):
+        r"""Parses lines appended since the last poll. A last line which is
+        not terminated yet is left for the next poll. If the file has been
+        replaced or has got shorter, it is read again from the start.
+
+        .. sourcecode:: pycon
+
+           >>> import shutil, tempfile
+           >>> root = tempfile.mkdtemp()
+           >>> os.makedirs(os.path.join(root, "srv"))
+           >>> path = os.path.join(root, "srv", "#a.2010-08-04.log")
+           >>> def write(data, mode="a"):
+           ...     with open(path, mode) as file:
+           ...         file.write(data)
+           >>> write("10:00 <hong> one\n10:01 <hong> tw")
+           >>> archive = Archive(root + "/<server>/<channel>"
+           ...                   ".<date:%Y-%m-%d>.log", encoding="utf-8")
+           >>> tail = archive["srv"]["#a"].latest()[0].tail()
+           >>> [message.line for message in tail.poll()], tail.offset
+           ([u'one'], 17)
+           >>> write("o\n10:02 <hong> three\n")
+           >>> [message.line for message in tail.poll()], tail.offset
+           ([u'two', u'three'], 53)
+           >>> tail.poll()
+           []
+
+        A file which has been truncated, or replaced with a new one as log
+        rotation does, is read from the start:
+
+        .. sourcecode:: pycon
+
+           >>> write("10:03 <hong> four\n", "w")
+           >>> [message.line for message in tail.poll()]
+           [u'four']
+           >>> with open(path + ".new", "w") as file:
+           ...     file.write("10:04 <hong> five\n10:05 <hong> six\n")
+           >>> os.rename(path + ".new", path)
+           >>> [message.line for message in tail.poll()]
+           [u'five', u'six']
+           >>> shutil.rmtree(root)
+
+        :returns: a :class:`list` of :class:`irclog.messages.BaseMessage`
+                  instances
+
+        """
+        if self.path is None:
+            self.path = self.log.path
+            if self.path is None:
+                return []
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self.path = None
+            return []
+        if stat.st_ino != self._inode or stat.st_size < self.offset:
+            if self._inode is not None or stat.st_size < self.offset:
+                self.offset = 0
+            self._inode = stat.st_ino
+            self.encoding = None
+        if stat.st_size == self.offset:
+            return []
+        if self.encoding is None:
+            channel = self.log.channel
+            self.encoding = channel.encoding or detect_encoding(self.path)
+        with open(self.path, "rb") as file:
+            file.seek(self.offset)
+            data = file.read(stat.st_size - self.offset)
+        end = data.rfind("\n") + 1
+        if not end:
+            return []
+        self.offset += end
+        lines = irclog.parser.split_lines(data[:end], self.encoding)
+        return list(irclog.parser.parse(lines, self.log.date, self.encoding,
+                                        self.log.archive.intern_table()))
+
+    def follow(self, interval=1.0, timeout=None):
+        """Yields messages as they are appended, polling every ``interval``
+        seconds.
+
+        :param interval: seconds between polls
+        :type interval: :class:`float`
+        :param timeout: stops when no message has been appended for this
+                        many seconds. default is ``None`` which means never
+                        to stop
+        :type timeout: :class:`float`
+        :returns: :class:`irclog.messages.BaseMessage` instances
+
+        .. note:: This is exactly a generator function.
+
+        """
+        waited = 0
+        while timeout is None or waited < timeout:
+            messages = self.poll()
+            if messages:
+                waited = 0
+                for message in messages:
+                    yield message
+            else:
+                time.sleep(interval)
+                waited += interval
+
+    def __repr__(self):
+        t = type(self)
+        mod = "" if t.__module__ == "__main__" else t.__module__ + "."
+        clsname = mod + t.__name__
+        return "{0}({1!r}, {2!r})".format(clsname, self.log, self.offset)
+
+
+def parse_logs(logs, processes=None, chunk_size=irclog.parser.CHUNK_SIZE):
+    """Parses logs in worker processes. Messages are yielded in the order
+    of ``logs``, the same as iterating them one by one.
+
+    .. sourcecode:: python
+
+       channel = Archive("/logs/<server>/<channel>.<date:%Y-%m-%d>.log")\
+                 ["Freenode"]["#hongminhee"]
+       for message in parse_logs(channel, processes=8):
+           print message.messaged_at
+
+    :param logs: :class:`Log` instances
+    :type logs: iterable object
+    :param processes: the number of worker processes. default is the number
+                      of CPUs
+    :type processes: :class:`int`
+    :param chunk_size: the size of a chunk in bytes
+    :type chunk_size: :class:`int`
+    :returns: :class:`irclog.messages.BaseMessage` instances
+
+    .. seealso:: Function :func:`irclog.parser.parse_files()`
+
+    """
+    def files():
+        for log in logs:
+            path = log.path
+            if path is not None:
+                encoding = log.channel.encoding or detect_encoding(path)
+                yield path, log.date, encoding
+    return irclog.parser.parse_files(files(), processes, chunk_size)
+
+
+def _accepts(message, kinds, nicks):
+    if kinds is not None and not isinstance(message, kinds):
+        return False
+    if nicks is not None:
+        fields = message.FIELDS
+        name = "nick" if "nick" in fields else "from_"
+        nick = getattr(message, name, None)
+        return nick is not None and nick.lower() in nicks
+    return True
+
+
+def merge(sources, start=None, end=None, kinds=None, nicks=None):
+    r"""Merges messages of many logs or channels into one stream in the order
+    of :attr:`~irclog.messages.BaseMessage.messaged_at`. Only one message
+    of each source is kept at once, in a heap, so it takes as little memory
+    as iterating the sources one by one.
+
+    .. sourcecode:: python
+
+       archive = Archive("/logs/<server>/<channel>.<date:%Y-%m-%d>.log")
+       channels = [channel for server in archive for channel in server]
+       for log, message in merge(channels, start=datetime.date(2010, 8, 1),
+                                 kinds=irclog.messages.JoinMessage):
+           print log.channel, message.nick
+
+    Messages of different channels are interleaved by time, and a day of a
+    channel comes after the previous day of the other channels:
+
+    .. sourcecode:: pycon
+
+       >>> import shutil, tempfile
+       >>> root = tempfile.mkdtemp()
+       >>> os.makedirs(os.path.join(root, "srv"))
+       >>> def write(name, *lines):
+       ...     with open(os.path.join(root, "srv", name), "w") as file:
+       ...         file.write("\n".join(lines) + "\n")
+       >>> write("#a.2010-08-03.log", "23:00 <hong> a1", "23:30 <DrSlem> a2")
+       >>> write("#a.2010-08-04.log", "10:00 <hong> a3")
+       >>> write("#b.2010-08-03.log", "22:00 <DrSlem> b1",
+       ...       "23:15 -!- hong [~hong@example.com] has joined #b",
+       ...       "23:45 <hong> b2")
+       >>> archive = Archive(root + "/<server>/<channel>.<date:%Y-%m-%d>.log",
+       ...                   encoding="utf-8")
+       >>> for log, message in merge([archive]):
+       ...     print log.channel, message.messaged_at, type(message).__name__
+       #b 2010-08-03 22:00:00 PublicMessage
+       #a 2010-08-03 23:00:00 PublicMessage
+       #b 2010-08-03 23:15:00 JoinMessage
+       #a 2010-08-03 23:30:00 PublicMessage
+       #b 2010-08-03 23:45:00 PublicMessage
+       #a 2010-08-04 10:00:00 PublicMessage
+
+    ``kinds`` and ``nicks`` are given down to each log, and ``start`` and
+    ``end`` choose the logs of channels:
+
+    .. sourcecode:: pycon
+
+       >>> for log, message in merge(archive["srv"], nicks=["HONG"],
+       ...                           kinds=irclog.messages.PublicMessage):
+       ...     print log.channel, message.line
+       #a a1
+       #b b2
+       #a a3
+       >>> [message.line for _, message in
+       ...  merge(archive["srv"], start=datetime.date(2010, 8, 4))]
+       [u'a3']
+       >>> shutil.rmtree(root)
+
+    :param sources: :class:`Log` or :class:`Channel` instances, or
+                    :class:`Server` and :class:`Archive` instances, which
+                    are taken as all of their channels. messages of each
+                    source have to be in order
+    :type sources: iterable object
+    :param start: the first date of logs of channels. default is ``None``
+                  which means the first log
+    :type start: :class:`datetime.date`
+    :param end: the last date of logs of channels. default is ``None``
+                which means the last log
+    :type end: :class:`datetime.date`
+    :param kinds: message types to take. see :meth:`Log.messages()`
+    :type kinds: :class:`type`, :class:`tuple`
+    :param nicks: nicks whose messages to take. see :meth:`Log.messages()`
+    :type nicks: iterable object
+    :returns: ``(log, message)`` pairs
+
+    .. note:: This is exactly a generator function.
+
+    """
+    def logs(source):
+        if isinstance(source, Log):
+            return [source]
+        return source.logs_between(start or datetime.date.min,
+                                   end or datetime.date.max)
+    def messages(source):
+        for log in logs(source):
+            for message in log.messages(kinds, nicks):
+                yield log, message
+    heap = []
+    for source in sources:
+        if isinstance(source, (Archive, Server)):
+            channels = (channel for server in
+                        (source if isinstance(source, Archive) else [source])
+                        for channel in server)
+        else:
+            channels = [source]
+        for channel in channels:
+            iterator = messages(channel)
+            for log, message in iterator:
+                # The index of the source breaks ties, so that messages and
+                # logs are never compared.
+                heap.append((message.messaged_at, len(heap), log, message,
+                             iterator))
+                break
+    heapq.heapify(heap)
+    while heap:
+        _, index, log, message, iterator = heap[0]
+        yield log, message
+        for log, message in iterator:
+            heapq.heapreplace(heap, (message.messaged_at, index, log,
+                                     message, iterator))
+            break
+        else:
+            heapq.heappop(heap)
+
+
 Archive.ELEMENT_CLASS = Server
 Server.ELEMENT_CLASS = Channel
 Channel.ELEMENT_CLASS = Log
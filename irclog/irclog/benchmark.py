@@ -0,0 +1,360 @@
+""":mod:`irclog.benchmark` --- Parser benchmarks
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module measures how fast :mod:`irclog.parser` goes through logs. It can
+be run as a script with log files to parse:
+
+.. sourcecode:: console
+
+   $ python -m irclog.benchmark /logs/Freenode/#hongminhee.2010-08-04.log
+
+When no log files are given, it generates a synthetic log of 300000 lines
+instead. The figures below are of such a run on a machine with a single
+CPU, so they show the overhead of worker processes rather than any speedup:
+
+.. sourcecode:: console
+
+   parse: 300000 lines in 2.54 s (118002 lines/s)
+
+It also measures :func:`irclog.parser.parse_files()`, which decodes every
+message in the current process, and :func:`irclog.parser.parse_chunks()`,
+which leaves chunks encoded, with different numbers of worker processes,
+including the current process alone:
+
+.. sourcecode:: console
+
+   parse_files (1 processes): 300000 lines in 2.04 s (146752 lines/s)
+   parse_chunks (1 processes): 300000 lines in 1.86 s (161026 lines/s)
+   parse_files (2 processes): 300000 lines in 2.92 s (102581 lines/s)
+   parse_chunks (2 processes): 300000 lines in 2.02 s (148368 lines/s)
+   parse_files (4 processes): 300000 lines in 2.74 s (109688 lines/s)
+   parse_chunks (4 processes): 300000 lines in 2.24 s (133960 lines/s)
+
+On a machine with several CPUs, :func:`~irclog.parser.parse_files()` is
+still bound by decoding every message in the current process, while
+:func:`~irclog.parser.parse_chunks()` is bound only by the workers.
+
+It also measures :func:`irclog.parser.tokenize()` against the plain
+:data:`irclog.parser.PATTERN` on the same lines. That they agree is checked
+by the doctests of :func:`irclog.parser.tokenize()`.
+
+Lastly it measures how much memory a year of a synthetic channel takes when
+it is held in memory: as message objects, as message objects whose nicks and
+channels are interned, and as a :class:`irclog.columnar.MessageBatch`.
+
+.. sourcecode:: console
+
+   memory (objects): 593125 messages in 203.0 MiB
+   memory (interned): 593125 messages in 140.1 MiB
+   memory (batch): 593125 messages in 51.1 MiB
+
+.. data:: SAMPLE_LINES
+
+   The lines the synthetic log is made of. Public messages are the most
+   common, as in real logs.
+
+.. data:: PROCESSES
+
+   The numbers of worker processes :func:`bench_parse_files()` is measured
+   with.
+
+.. data:: MEMORY_DAYS
+
+   The number of days of the synthetic channel :func:`bench_memory()`
+   holds in memory.
+
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import datetime
+import itertools
+import resource
+import multiprocessing
+import irclog.parser
+
+
+SAMPLE_LINES = ["--- Log opened Sun Aug 01 00:00:01 2010",
+                "10:01 <@DrSlem> hmmm, internettet mitt er treigt i dag",
+                "10:02 <+_neon_> DE ER DI R\xc3\x98DGR\xc3\x98NNE SOMM HAR SKYLLA",
+                "10:02 < vrakrav_> NISSELUER!",
+                "10:03 <runehol> eller mest sannsynlig; en konspirasjon!",
+                "10:03:12 <Skuggen> JULEKALENDER!",
+                "10:04  * daven rages",
+                "10:04 -daven:#rageit- POSTKASSE!",
+                "10:05 -!- hong [~hong@example.com] has joined #rageit",
+                "10:05 -!- hong is now known as hongminhee",
+                "10:06 -!- mode/#rageit [+o hongminhee] by DrSlem",
+                "10:06 -!- Irssi: Join to #rageit was synced in 1 secs",
+                "10:07 -!- hongminhee [~hong@example.com] has quit [Quit: bye]",
+                "10:08 <@DrSlem> hmmm, internettet mitt er treigt i dag",
+                "10:09 <runehol> N\xc3\x85 M\xc3\x85 JENS \xc3\x85 CO G\xc3\x85",
+                "--- Day changed Mon Aug 02 2010"]
+
+
+PROCESSES = 1, 2, 4
+
+MEMORY_DAYS = 365
+
+
+def sample_lines(count):
+    """Makes a synthetic log of ``count`` lines.
+
+    :param count: the number of lines
+    :type count: :class:`int`
+    :returns: a :class:`list` of lines
+
+    """
+    return list(itertools.islice(itertools.cycle(SAMPLE_LINES), count))
+
+
+def measure(function, *args, **kwargs):
+    """Calls ``function`` and returns the seconds it took with its result.
+
+    :param function: a function to measure
+    :type function: callable object
+    :returns: a pair of ``(seconds, result)``
+
+    """
+    started_at = time.time()
+    result = function(*args, **kwargs)
+    return time.time() - started_at, result
+
+
+def bench_parse(lines, date=None):
+    """Measures :func:`irclog.parser.parse()`.
+
+    :param lines: lines of log
+    :type lines: :class:`list`
+    :param date: a date of the log
+    :type date: :class:`datetime.date`
+    :returns: a pair of ``(seconds, number_of_messages)``
+
+    """
+    date = date or datetime.date.today()
+    return measure(lambda: sum(1 for _ in irclog.parser.parse(lines, date)))
+
+
+def bench_read(filename, date=None):
+    """Measures parsing a log file by iterating its lines against reading
+    it with :func:`irclog.parser.read_lines()`.
+
+    :param filename: a filename of log
+    :type filename: :class:`basestring`
+    :param date: a date of the log
+    :type date: :class:`datetime.date`
+    :returns: a pair of ``(file_seconds, read_lines_seconds)``
+
+    """
+    date = date or datetime.date.today()
+    def parse(lines):
+        return sum(1 for _ in irclog.parser.parse(lines, date))
+    with open(filename, "rb") as file:
+        file_seconds, _ = measure(parse, file)
+    with open(filename, "rb") as file:
+        read_lines_seconds, _ = measure(parse, irclog.parser.read_lines(file))
+    return file_seconds, read_lines_seconds
+
+
+def bench_parse_files(filenames, processes, date=None):
+    """Measures :func:`irclog.parser.parse_files()` with ``processes``
+    worker processes, taking every message it yields.
+
+    :param filenames: filenames of logs
+    :type filenames: :class:`list`
+    :param processes: the number of worker processes
+    :type processes: :class:`int`
+    :param date: a date of the logs
+    :type date: :class:`datetime.date`
+    :returns: a pair of ``(seconds, number_of_messages)``
+
+    """
+    date = date or datetime.date.today()
+    files = [(filename, date) for filename in filenames]
+    return measure(lambda: sum(1 for _ in irclog.parser.parse_files(
+        files, processes, chunk_size=256 * 1024
+    )))
+
+
+def bench_parse_chunks(filenames, processes, date=None):
+    """Measures :func:`irclog.parser.parse_chunks()` with ``processes``
+    worker processes, taking only the length of each chunk it yields, so
+    that no message is decoded in the current process.
+
+    :param filenames: filenames of logs
+    :type filenames: :class:`list`
+    :param processes: the number of worker processes
+    :type processes: :class:`int`
+    :param date: a date of the logs
+    :type date: :class:`datetime.date`
+    :returns: a pair of ``(seconds, number_of_messages)``
+
+    """
+    date = date or datetime.date.today()
+    files = [(filename, date) for filename in filenames]
+    return measure(lambda: sum(len(chunk) for chunk in
+                               irclog.parser.parse_chunks(
+                                   files, processes, chunk_size=256 * 1024
+                               )))
+
+
+def bench_tokenize(lines):
+    """Measures :func:`irclog.parser.tokenize()` against matching the plain
+    :data:`irclog.parser.PATTERN` and taking the groups on each line.
+
+    :param lines: decoded and stripped lines of log
+    :type lines: :class:`list`
+    :returns: a pair of ``(pattern_seconds, tokenize_seconds)``
+
+    """
+    def match(line):
+        match = irclog.parser.PATTERN.match(line)
+        if match and match.lastgroup in irclog.parser.RULE_GROUPS:
+            names = irclog.parser.RULE_GROUPS[match.lastgroup]
+            return match.lastgroup, match.group(*names)
+    pattern_seconds, _ = measure(map, match, lines)
+    tokenize_seconds, _ = measure(map, irclog.parser.tokenize, lines)
+    return pattern_seconds, tokenize_seconds
+
+
+def resident_size():
+    """Returns the resident set size of the current process. It is read
+    from :file:`/proc/self/statm` where available, and falls back to the
+    peak size :func:`resource.getrusage()` gives.
+
+    :returns: the size in bytes
+
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+    except (IOError, IndexError, ValueError):
+        size = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return size * 1024 if sys.platform != "darwin" else size
+    return pages * resource.getpagesize()
+
+
+def _hold_messages(days, lines_per_day, how, connection):
+    lines = sample_lines(lines_per_day)
+    first = datetime.date(2010, 1, 1)
+    interns = {} if how == "interned" else None
+    batch = None
+    held = []
+    before = resident_size()
+    for day in xrange(days):
+        date = first + datetime.timedelta(days=day)
+        if how == "batch":
+            batch = irclog.parser.parse_batch(lines, date, batch=batch)
+        else:
+            held.extend(irclog.parser.parse(lines, date, interns=interns))
+    if batch is not None:
+        batch.text
+    connection.send((resident_size() - before, len(batch or held)))
+    connection.close()
+
+
+def bench_memory(how, days=MEMORY_DAYS, lines_per_day=2000):
+    """Measures the memory logs of ``days`` days take when they are held in
+    memory. Each measurement is made in a new process.
+
+    :param how: ``"objects"`` to hold message objects, ``"interned"`` to
+                hold message objects whose identifiers are interned across
+                all days, or ``"batch"`` to hold a
+                :class:`irclog.columnar.MessageBatch`
+    :type how: :class:`str`
+    :param days: the number of days
+    :type days: :class:`int`
+    :param lines_per_day: the number of lines of a day
+    :type lines_per_day: :class:`int`
+    :returns: a pair of ``(bytes, number_of_messages)``
+
+    """
+    receiver, sender = multiprocessing.Pipe(False)
+    process = multiprocessing.Process(
+        target=_hold_messages, args=(days, lines_per_day, how, sender)
+    )
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def report(name, lines, seconds, stream=sys.stdout):
+    """Prints a line of the benchmark result.
+
+    :param name: a benchmark name
+    :type name: :class:`basestring`
+    :param lines: the number of lines processed
+    :type lines: :class:`int`
+    :param seconds: the time taken
+    :type seconds: :class:`float`
+
+    """
+    rate = lines / seconds if seconds else float("inf")
+    print >> stream, "{0}: {1} lines in {2:.2f} s ({3:.0f} lines/s)".format(
+        name, lines, seconds, rate
+    )
+
+
+def main(argv=sys.argv):
+    """The benchmark script entry point.
+
+    :param argv: command line arguments. the rest of the first are filenames
+                 of logs to parse
+    :type argv: :class:`list`
+
+    """
+    if len(argv) > 1:
+        lines = []
+        for filename in argv[1:]:
+            with open(filename) as file:
+                lines.extend(file)
+    else:
+        lines = sample_lines(300000)
+    seconds, _ = bench_parse(lines)
+    report("parse", len(lines), seconds)
+    for filename in argv[1:]:
+        with open(filename) as file:
+            count = sum(1 for _ in file)
+        file_seconds, read_lines_seconds = bench_read(filename)
+        report("parse file " + filename, count, file_seconds)
+        report("parse read_lines " + filename, count, read_lines_seconds)
+    if len(argv) > 1:
+        filenames = argv[1:]
+        temp_dir = None
+    else:
+        temp_dir = tempfile.mkdtemp()
+        filenames = [os.path.join(temp_dir, "sample.log")]
+        with open(filenames[0], "wb") as file:
+            file.writelines(line + "\n" for line in lines)
+    try:
+        for processes in PROCESSES:
+            seconds, _ = bench_parse_files(filenames, processes)
+            report("parse_files ({0} processes)".format(processes),
+                   len(lines), seconds)
+            seconds, _ = bench_parse_chunks(filenames, processes)
+            report("parse_chunks ({0} processes)".format(processes),
+                   len(lines), seconds)
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+    decoded = [line.decode("utf-8", "replace").strip() for line in lines]
+    pattern_seconds, tokenize_seconds = bench_tokenize(decoded)
+    report("PATTERN.match", len(decoded), pattern_seconds)
+    report("tokenize", len(decoded), tokenize_seconds)
+    pubmsgs = [line for line in decoded
+               if irclog.parser.PUBMSG_PATTERN.match(line)]
+    pattern_seconds, tokenize_seconds = bench_tokenize(pubmsgs)
+    report("PATTERN.match (pubmsg)", len(pubmsgs), pattern_seconds)
+    report("tokenize (pubmsg)", len(pubmsgs), tokenize_seconds)
+    for how in "objects", "interned", "batch":
+        size, count = bench_memory(how)
+        print "memory ({0}): {1} messages in {2:.1f} MiB".format(
+            how, count, size / 1024.0 / 1024
+        )
+
+
+if __name__ == "__main__":
+    main()
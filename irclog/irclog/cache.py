@@ -0,0 +1,196 @@
+""":mod:`irclog.cache` --- Parsed log cache
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides a cache of parsed log files, so logs of past days,
+which never change, are not parsed again every time they are read.
+Messages are cached in the binary format of :mod:`irclog.codec`, the same
+one compacted log files (see :mod:`irclog.compact`) are in, in memory with
+least-recently-used eviction and optionally in files on disk. Entries are
+keyed by the path, size and modification time of a log file.
+
+.. sourcecode:: python
+
+   archive = Archive("/logs/<server>/<channel>.<date:%Y-%m-%d>.log",
+                     cache=LogCache(path="/var/cache/irclog/logs"))
+
+"""
+import os
+import time
+import marshal
+import hashlib
+import collections
+import irclog.codec
+
+
+def encode_messages(messages):
+    """Encodes messages into the binary format of :mod:`irclog.codec`.
+
+    :param messages: :class:`irclog.messages.BaseMessage` instances
+    :type messages: iterable object
+    :returns: a :class:`str`
+
+    """
+    return irclog.codec.encode(messages)
+
+
+def decode_messages(data, interns=None):
+    """Decodes messages from the binary format of :mod:`irclog.codec`. See
+    :func:`encode_messages()`.
+
+    :param data: an encoded form
+    :type data: :class:`str`
+    :param interns: the table of identifiers to share. see
+                    :func:`irclog.parser.tokens()`
+    :type interns: :class:`dict`
+    :returns: a :class:`list` of :class:`irclog.messages.BaseMessage`
+              instances
+    :raises ValueError: when ``data`` is not an encoded form or it has
+                        another :data:`irclog.codec.VERSION`
+
+    """
+    messages = irclog.codec.EncodedMessages(data)
+    if interns is not None:
+        messages.intern_identifiers(interns)
+    return list(messages)
+
+
+class LogCache(object):
+    """The cache of parsed log files.
+
+    :param capacity: the total bytes of encoded forms to keep in memory
+    :type capacity: :class:`int`
+    :param path: the directory to keep encoded forms in. default is
+                 ``None`` which means to keep them only in memory
+    :type path: :class:`basestring`
+    :param min_age: seconds since the last modification of a log file
+                    before it is cached. files which are still being written
+                    are not worth caching
+    :type min_age: :class:`float`
+
+    """
+
+    CAPACITY = 64 * 1024 * 1024
+    MIN_AGE = 60.0
+
+    __slots__ = "capacity", "path", "min_age", "size", "_entries"
+
+    def __init__(self, capacity=CAPACITY, path=None, min_age=MIN_AGE):
+        self.capacity = capacity
+        self.path = path
+        self.min_age = min_age
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        if path is not None and not os.path.isdir(path):
+            os.makedirs(path)
+
+    @staticmethod
+    def key(filename):
+        """Makes the key of a log file.
+
+        :param filename: a path of log file
+        :type filename: :class:`basestring`
+        :returns: a ``(path, size, mtime)`` tuple
+
+        """
+        stat = os.stat(filename)
+        return os.path.abspath(filename), stat.st_size, stat.st_mtime
+
+    def _cache_filename(self, path):
+        if isinstance(path, unicode):
+            path = path.encode("utf-8")
+        return os.path.join(self.path, hashlib.sha1(path).hexdigest())
+
+    def get(self, key):
+        """Finds the encoded form of ``key``.
+
+        :param key: a key made by :meth:`key()`
+        :returns: an encoded form, or ``None``
+
+        """
+        try:
+            data = self._entries.pop(key)
+        except KeyError:
+            data = None
+            if self.path is not None:
+                data = self._read(key)
+            if data is None:
+                return None
+            self.size += len(data)
+        self._entries[key] = data
+        self._evict()
+        return data
+
+    def put(self, key, data):
+        """Stores the encoded form of ``key``.
+
+        :param key: a key made by :meth:`key()`
+        :param data: an encoded form
+        :type data: :class:`str`
+
+        """
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._entries[key] = data
+        self.size += len(data)
+        self._evict()
+        if self.path is not None:
+            self._write(key, data)
+
+    def _evict(self):
+        while self.size > self.capacity and self._entries:
+            _, data = self._entries.popitem(last=False)
+            self.size -= len(data)
+
+    def _read(self, key):
+        try:
+            with open(self._cache_filename(key[0]), "rb") as file:
+                cached_key, data = marshal.load(file)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+        return data if tuple(cached_key) == key else None
+
+    def _write(self, key, data):
+        filename = self._cache_filename(key[0])
+        temp_filename = "{0}.{1}.tmp".format(filename, os.getpid())
+        with open(temp_filename, "wb") as file:
+            marshal.dump((key, data), file)
+        os.rename(temp_filename, filename)
+
+    def messages(self, filename, parse, interns=None):
+        """Returns the messages of a log file, from the cache if possible.
+
+        :param filename: a path of log file
+        :type filename: :class:`basestring`
+        :param parse: a function which parses the log file
+        :type parse: callable object
+        :param interns: the table of identifiers to share with cached
+                        messages. see :func:`irclog.parser.tokens()`
+        :type interns: :class:`dict`
+        :returns: a :class:`list` of :class:`irclog.messages.BaseMessage`
+                  instances
+
+        """
+        key = self.key(filename)
+        data = self.get(key)
+        if data is not None:
+            try:
+                return decode_messages(data, interns)
+            except ValueError:
+                pass
+        messages = list(parse())
+        if time.time() - key[2] >= self.min_age and self.key(filename) == key:
+            self.put(key, encode_messages(messages))
+        return messages
+
+    def clear(self):
+        """Clears the cache in memory."""
+        self._entries.clear()
+        self.size = 0
+
+    def __repr__(self):
+        t = type(self)
+        mod = "" if t.__module__ == "__main__" else t.__module__ + "."
+        return "{0}{1}(capacity={2!r}, path={3!r})".format(
+            mod, t.__name__, self.capacity, self.path
+        )
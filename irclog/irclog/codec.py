@@ -0,0 +1,390 @@
+""":mod:`irclog.codec` --- Binary message format
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides a compact binary format of messages in
+:mod:`irclog.messages`, to keep parsed logs without parsing raw text again.
+
+.. sourcecode:: pycon
+
+   >>> import irclog.parser
+   >>> messages = list(irclog.parser.parse([
+   ...     u"10:01 <@DrSlem> hmmm",
+   ...     u"10:02 -!- hong [~hong@example.com] has joined #rageit",
+   ...     u"10:03 <hong> DrSlem: hmmm"
+   ... ], datetime.date(2010, 8, 4)))
+   >>> data = encode(messages)
+   >>> [type(m).__name__ for m in decode(data)]
+   ['PublicMessage', 'JoinMessage', 'PublicMessage']
+   >>> EncodedMessages(data)[2].line
+   u'DrSlem: hmmm'
+
+An encoded form consists of:
+
+1. :data:`MAGIC` and the :data:`VERSION` byte.
+2. The header: the number of messages, the base epoch seconds, the number
+   of strings and the size of records, all unsigned varints.
+3. The string table: the length of each string in UTF-8 bytes, as
+   varints, and then all strings in one UTF-8 text. Each distinct string is
+   stored once. Lengths in bytes are the same on narrow and wide builds of
+   Python, which count characters beyond the BMP differently.
+4. Records, one for each message: the kind tag (the index of the message
+   type in :data:`irclog.messages.MESSAGE_TYPES`), the seconds since the
+   base, and the string reference of each field of the type's ``FIELDS``,
+   all varints. The reference of ``None`` is 0, and the reference of the
+   ``n``-th string is ``n + 1``.
+5. The offsets table: the byte offset of each record, as little-endian
+   unsigned 32-bit integers. It gives random access by message index.
+
+Fields have to be :class:`unicode` or ``None``, as parsed messages are.
+
+.. data:: MAGIC
+
+   The bytes every encoded form starts with.
+
+.. data:: VERSION
+
+   The version of the format.
+
+"""
+import sys
+import array
+import datetime
+import irclog.messages
+
+
+MAGIC = "IRCM"
+VERSION = 3
+
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+
+def encode_varints(values):
+    """Encodes unsigned integers into varints: 7 bits in each byte, least
+    significant first, and the high bit set on all bytes but the last.
+
+    .. sourcecode:: pycon
+
+       >>> encode_varints([0, 1, 127, 128, 300])
+       '\\x00\\x01\\x7f\\x80\\x01\\xac\\x02'
+
+    :param values: unsigned integers
+    :type values: iterable object
+    :returns: a :class:`str`
+
+    """
+    result = bytearray()
+    append = result.append
+    for value in values:
+        while value > 127:
+            append(value & 127 | 128)
+            value >>= 7
+        append(value)
+    return str(result)
+
+
+def decode_varints(data, start=0, end=None, count=None):
+    """Decodes varints. See :func:`encode_varints()`.
+
+    .. sourcecode:: pycon
+
+       >>> decode_varints('\\x00\\x01\\x7f\\x80\\x01\\xac\\x02')
+       [0, 1, 127, 128, 300]
+
+    :param data: encoded varints
+    :type data: :class:`str`
+    :param start: the offset to start from
+    :type start: :class:`int`
+    :param end: the offset to stop at. default is the end of ``data``
+    :type end: :class:`int`
+    :param count: the number of varints to decode. default is to decode
+                  all of them to ``end``
+    :type count: :class:`int`
+    :returns: a :class:`list` of integers
+
+    """
+    values = []
+    append = values.append
+    value = shift = 0
+    if count is None:
+        for byte in bytearray(data[start:end]):
+            if byte < 128:
+                append(value | byte << shift)
+                value = shift = 0
+            else:
+                value |= (byte & 127) << shift
+                shift += 7
+        return values
+    # Varints take 5 bytes at most for the values this module writes.
+    for byte in bytearray(data[start:start + count * 5]):
+        if byte < 128:
+            append(value | byte << shift)
+            if len(values) == count:
+                break
+            value = shift = 0
+        else:
+            value |= (byte & 127) << shift
+            shift += 7
+    return values
+
+
+def _seconds(when):
+    return ((when.toordinal() - EPOCH_ORDINAL) * 86400 +
+            when.hour * 3600 + when.minute * 60 + when.second)
+
+
+def encode(messages):
+    """Encodes messages into the binary format.
+
+    :param messages: :class:`irclog.messages.BaseMessage` instances
+    :type messages: iterable object
+    :returns: a :class:`str`
+
+    """
+    return encode_rows((type(message), message.messaged_at,
+                        [getattr(message, name) for name in message.FIELDS])
+                       for message in messages)
+
+
+def encode_rows(rows):
+    """Encodes messages into the binary format without making them first.
+    See :func:`encode()`.
+
+    :param rows: ``(cls, messaged_at, fields)`` triples. see
+                 :meth:`irclog.columnar.MessageBatch.append_row()`
+    :type rows: iterable object
+    :returns: a :class:`str`
+    :raises KeyError: when ``cls`` is not in
+                      :data:`irclog.messages.MESSAGE_TYPES`
+
+    """
+    kinds = dict((cls, i) for i, cls
+                 in enumerate(irclog.messages.MESSAGE_TYPES))
+    base = None
+    strings = []
+    refs = {None: 0}
+    encoded_rows = []
+    for cls, messaged_at, fields in rows:
+        seconds = _seconds(messaged_at)
+        if base is None or seconds < base:
+            base = seconds
+        row = [kinds[cls], seconds]
+        for value in fields:
+            try:
+                row.append(refs[value])
+            except KeyError:
+                strings.append(value)
+                row.append(refs.setdefault(value, len(strings)))
+        encoded_rows.append(row)
+    rows = encoded_rows
+    base = base or 0
+    records = bytearray()
+    append = records.append
+    offsets = array.array("I")
+    for row in rows:
+        offsets.append(len(records))
+        row[1] -= base
+        for value in row:
+            while value > 127:
+                append(value & 127 | 128)
+                value >>= 7
+            append(value)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    strings = [string.encode("utf-8") for string in strings]
+    text = "".join(strings)
+    return "".join([
+        MAGIC, chr(VERSION),
+        encode_varints([len(rows), base, len(strings), len(records)]),
+        encode_varints(len(string) for string in strings),
+        encode_varints([len(text)]), text, str(records), offsets.tostring()
+    ])
+
+
+def dump(messages, file):
+    """Writes messages in the binary format to ``file``.
+
+    :param messages: :class:`irclog.messages.BaseMessage` instances
+    :type messages: iterable object
+    :param file: a file object opened in binary mode
+    :type file: file object
+
+    """
+    file.write(encode(messages))
+
+
+class EncodedMessages(object):
+    """The sequence of messages in an encoded form. Only the header and the
+    string table are decoded at first, and each message is decoded when
+    it is accessed.
+
+    :param data: an encoded form
+    :type data: :class:`str`, :class:`mmap.mmap`
+    :raises ValueError: when ``data`` is not an encoded form or it has
+                        another :data:`VERSION`
+
+    """
+
+    __slots__ = ("data", "base", "strings", "offsets", "records_start",
+                 "records_end", "_times")
+
+    def __init__(self, data):
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("not an encoded form of messages")
+        version = ord(data[len(MAGIC)])
+        if version != VERSION:
+            raise ValueError("unsupported version: " + repr(version))
+        self.data = data
+        position = len(MAGIC) + 1
+        header = decode_varints(data, position, count=4)
+        count, self.base, string_count, size = header
+        position += len(encode_varints(header))
+        lengths = decode_varints(data, position, count=string_count + 1)
+        position += len(encode_varints(lengths))
+        text_size = lengths.pop()
+        text = data[position:position + text_size]
+        position += text_size
+        decoded = text.decode("utf-8")
+        strings = [None]
+        start = 0
+        if len(decoded) == text_size:
+            # All ASCII, so characters are where bytes are.
+            for length in lengths:
+                strings.append(decoded[start:start + length])
+                start += length
+        else:
+            for length in lengths:
+                strings.append(text[start:start + length].decode("utf-8"))
+                start += length
+        self.strings = strings
+        self.records_start = position
+        self.records_end = position + size
+        self.offsets = array.array("I")
+        self.offsets.fromstring(
+            data[self.records_end:self.records_end + count * 4]
+        )
+        if sys.byteorder != "little":
+            self.offsets.byteswap()
+        if len(self.offsets) != count:
+            raise ValueError("truncated encoded form")
+        self._times = {}
+
+    def messaged_at(self, seconds):
+        """Makes the :class:`datetime.datetime` of ``seconds`` since the
+        base. The same one is returned for the same ``seconds``.
+
+        """
+        try:
+            return self._times[seconds]
+        except KeyError:
+            when = self._times[seconds] = EPOCH + datetime.timedelta(
+                seconds=self.base + seconds
+            )
+            return when
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+        start = self.records_start + self.offsets[index]
+        kind, = decode_varints(self.data, start, count=1)
+        cls = irclog.messages.MESSAGE_TYPES[kind]
+        row = decode_varints(self.data, start, count=2 + len(cls.FIELDS))
+        strings = self.strings
+        return cls(self.messaged_at(row[1]), *[strings[i] for i in row[2:]])
+
+    def __iter__(self):
+        types = irclog.messages.MESSAGE_TYPES
+        strings = self.strings
+        messaged_at = self.messaged_at
+        widths = [len(cls.FIELDS) for cls in types]
+        values = decode_varints(self.data, self.records_start,
+                                self.records_end)
+        i = 0
+        length = len(values)
+        while i < length:
+            kind = values[i]
+            end = i + 2 + widths[kind]
+            yield types[kind](messaged_at(values[i + 1]),
+                              *[strings[ref] for ref in values[i + 2:end]])
+            i = end
+
+    def intern_identifiers(self, interns):
+        """Shares the strings of identifier fields (see
+        :data:`irclog.messages.IDENTIFIER_FIELDS`) with ``interns``. Each
+        distinct string is stored once in the string table, so a string is
+        looked up once however many messages have it.
+
+        .. sourcecode:: pycon
+
+           >>> import irclog.parser
+           >>> interns = {}
+           >>> messages = EncodedMessages(encode(irclog.parser.parse([
+           ...     u"10:01 <hong> hmmm", u"10:02 <hong> hong"
+           ... ], datetime.date(2010, 8, 4))))
+           >>> messages.intern_identifiers(interns)
+           >>> sorted(interns)
+           [u'hong']
+           >>> messages[0].nick is messages[1].nick is interns[u"hong"]
+           True
+
+        :param interns: the table of identifiers to share. see
+                        :func:`irclog.parser.tokens()`
+        :type interns: :class:`dict`
+
+        """
+        types = irclog.messages.MESSAGE_TYPES
+        identifiers = [[i for i, name in enumerate(cls.FIELDS)
+                        if name in irclog.messages.IDENTIFIER_FIELDS]
+                       for cls in types]
+        widths = [len(cls.FIELDS) for cls in types]
+        values = decode_varints(self.data, self.records_start,
+                                self.records_end)
+        refs = set()
+        i = 0
+        length = len(values)
+        while i < length:
+            kind = values[i]
+            for index in identifiers[kind]:
+                refs.add(values[i + 2 + index])
+            i += 2 + widths[kind]
+        strings = self.strings
+        for ref in refs:
+            string = strings[ref]
+            if string is not None:
+                strings[ref] = interns.setdefault(string, string)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __repr__(self):
+        t = type(self)
+        mod = "" if t.__module__ == "__main__" else t.__module__ + "."
+        return "<{0}{1} of {2} messages>".format(mod, t.__name__, len(self))
+
+
+def decode(data):
+    """Decodes all messages of an encoded form at once.
+
+    :param data: an encoded form
+    :type data: :class:`str`, :class:`mmap.mmap`
+    :returns: a :class:`list` of :class:`irclog.messages.BaseMessage`
+              instances
+    :raises ValueError: when ``data`` is not an encoded form or it has
+                        another :data:`VERSION`
+
+    """
+    return list(EncodedMessages(data))
+
+
+def load(file):
+    """Reads all messages in the binary format from ``file``.
+
+    :param file: a file object opened in binary mode
+    :type file: file object
+    :returns: a :class:`list` of :class:`irclog.messages.BaseMessage`
+              instances
+
+    """
+    return decode(file.read())
@@ -0,0 +1,267 @@
+""":mod:`irclog.columnar` --- Columnar message batches
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides :class:`MessageBatch`, which keeps many messages in a
+few parallel arrays instead of an object per message: epoch seconds, kinds,
+nick ids and the offsets of the other fields in one UTF-8 buffer. It takes
+several times less memory than a :class:`list` of
+:class:`irclog.messages.BaseMessage` instances, and rows are turned into
+message objects only when they are accessed.
+
+.. sourcecode:: pycon
+
+   >>> import irclog.parser
+   >>> batch = irclog.parser.parse_batch([u"10:01 <@DrSlem> hmmm",
+   ...                                    u"10:02  * DrSlem rages"],
+   ...                                   datetime.date(2010, 8, 4))
+   >>> len(batch)
+   2
+   >>> message = batch[1]
+   >>> type(message).__name__, message.messaged_at, message.nick
+   ('ActionMessage', datetime.datetime(2010, 8, 4, 10, 2), u'DrSlem')
+   >>> batch.nicks
+   [u'DrSlem']
+
+:func:`irclog.parser.parse_batch()` fills a batch directly.
+
+.. data:: EPOCH
+
+   The :class:`datetime.datetime` that epoch seconds count from.
+
+"""
+import array
+import datetime
+import irclog.messages
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+#: The number of fields joined into a chunk of the text buffer at once.
+FOLD_SIZE = 4096
+
+#: The layout of each message type: the index of the field kept as a nick
+#: id, or ``None``, and the indices of the fields kept in the text buffer.
+_LAYOUTS = {}
+
+
+def _layout(cls):
+    try:
+        return _LAYOUTS[cls]
+    except KeyError:
+        fields = cls.FIELDS
+        for name in "nick", "from_":
+            if name in fields:
+                nick = fields.index(name)
+                break
+        else:
+            nick = None
+        texts = tuple(i for i in xrange(len(fields)) if i != nick)
+        layout = _LAYOUTS[cls] = nick, texts
+        return layout
+
+
+class MessageBatch(object):
+    """The columnar batch of messages. Each row is a message.
+
+    .. attribute:: times
+
+       The :class:`array.array` of the epoch seconds of messages.
+
+    .. attribute:: kinds
+
+       The :class:`array.array` of the kinds of messages, which are indices
+       of :data:`irclog.messages.MESSAGE_TYPES`.
+
+    .. attribute:: nick_ids
+
+       The :class:`array.array` of the nick ids of messages, which are
+       indices of :attr:`nicks`. ``-1`` means no nick. The nick of
+       :class:`irclog.messages.NickMessage` is its ``from_``.
+
+    .. attribute:: nicks
+
+       The :class:`list` of distinct nicks.
+
+    .. attribute:: field_starts
+
+       The :class:`array.array` of the first index of :attr:`field_ends`
+       each row has.
+
+    .. attribute:: field_ends
+
+       The :class:`array.array` of the byte offsets in :attr:`text` where the
+       fields other than the nick end. A field starts where the field before
+       it ends. A field which is ``None`` has the bitwise inversion of the
+       offset instead.
+
+    """
+
+    __slots__ = ("times", "kinds", "nick_ids", "nicks", "field_starts",
+                 "field_ends", "_nick_ids", "_chunks", "_pieces", "_length")
+
+    def __init__(self, messages=()):
+        self.times = array.array("l")
+        self.kinds = array.array("B")
+        self.nick_ids = array.array("i")
+        self.nicks = []
+        self.field_starts = array.array("l")
+        self.field_ends = array.array("l")
+        self._nick_ids = {}
+        self._chunks = []
+        self._pieces = []
+        self._length = 0
+        self.extend(messages)
+
+    @property
+    def text(self):
+        """The text buffer of the fields other than the nick, encoded in
+        UTF-8 to take less memory than :class:`unicode` does.
+
+        """
+        if self._pieces:
+            self._fold()
+        if len(self._chunks) > 1:
+            self._chunks[:] = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def _fold(self):
+        # Fields are joined into chunks as they are appended, so they are
+        # not kept as an object each until the text is read.
+        self._chunks.append("".join(self._pieces))
+        del self._pieces[:]
+
+    def nick_id(self, nick):
+        """Finds the id of ``nick``.
+
+        :param nick: a nick
+        :type nick: :class:`unicode`
+        :returns: the index of :attr:`nicks`, or ``-1`` if the batch has
+                  no such nick
+
+        """
+        return self._nick_ids.get(nick, -1)
+
+    def append_row(self, cls, messaged_at, fields):
+        """Appends a message without making it first.
+
+        :param cls: the type of the message
+        :type cls: :class:`type`
+        :param messaged_at: the time the message was sent
+        :type messaged_at: :class:`datetime.datetime`
+        :param fields: the arguments of ``cls`` after ``messaged_at``, in
+                       the order of its ``FIELDS``
+        :type fields: :class:`tuple`
+
+        """
+        nick, texts = _layout(cls)
+        self.times.append(
+            (messaged_at.toordinal() - EPOCH_ORDINAL) * 86400 +
+            messaged_at.hour * 3600 + messaged_at.minute * 60 +
+            messaged_at.second
+        )
+        self.kinds.append(irclog.messages.MESSAGE_TYPES.index(cls))
+        if nick is None or fields[nick] is None:
+            self.nick_ids.append(-1)
+        else:
+            try:
+                self.nick_ids.append(self._nick_ids[fields[nick]])
+            except KeyError:
+                self._nick_ids[fields[nick]] = len(self.nicks)
+                self.nick_ids.append(len(self.nicks))
+                self.nicks.append(fields[nick])
+        self.field_starts.append(len(self.field_ends))
+        length = self._length
+        for i in texts:
+            field = fields[i]
+            if field is None:
+                self.field_ends.append(~length)
+            else:
+                field = field.encode("utf-8")
+                self._pieces.append(field)
+                length += len(field)
+                self.field_ends.append(length)
+        self._length = length
+        if len(self._pieces) >= FOLD_SIZE:
+            self._fold()
+
+    def append(self, message):
+        """Appends a message.
+
+        :param message: a message
+        :type message: :class:`irclog.messages.BaseMessage`
+
+        """
+        self.append_row(type(message), message.messaged_at,
+                        tuple(getattr(message, name)
+                              for name in message.FIELDS))
+
+    def extend(self, messages):
+        """Appends messages.
+
+        :param messages: messages
+        :type messages: iterable object
+
+        """
+        for message in messages:
+            self.append(message)
+
+    def messaged_at(self, index):
+        """The time the message of ``index`` was sent.
+
+        :param index: a row index
+        :type index: :class:`int`
+        :returns: a :class:`datetime.datetime`
+
+        """
+        return EPOCH + datetime.timedelta(seconds=self.times[index])
+
+    def row(self, index):
+        """Reads a row without making its message.
+
+        :param index: a row index
+        :type index: :class:`int`
+        :returns: a ``(cls, messaged_at, fields)`` triple. see
+                  :meth:`append_row()`
+
+        """
+        cls = irclog.messages.MESSAGE_TYPES[self.kinds[index]]
+        nick, texts = _layout(cls)
+        text = self.text
+        first = self.field_starts[index]
+        fields = [None] * len(cls.FIELDS)
+        if first:
+            start = self.field_ends[first - 1]
+            start = ~start if start < 0 else start
+        else:
+            start = 0
+        for i, end in zip(texts, self.field_ends[first:first + len(texts)]):
+            if end < 0:
+                start = ~end
+            else:
+                fields[i] = text[start:end].decode("utf-8")
+                start = end
+        if nick is not None:
+            nick_id = self.nick_ids[index]
+            fields[nick] = self.nicks[nick_id] if nick_id >= 0 else None
+        return cls, self.messaged_at(index), tuple(fields)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("batch index out of range")
+        cls, messaged_at, fields = self.row(index)
+        return cls(messaged_at, *fields)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def __len__(self):
+        return len(self.times)
+
+    def __repr__(self):
+        t = type(self)
+        mod = "" if t.__module__ == "__main__" else t.__module__ + "."
+        return "<{0}{1} of {2} messages>".format(mod, t.__name__, len(self))
@@ -0,0 +1,236 @@
+""":mod:`irclog.compact` --- Archive compaction
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module turns the logs of past days in an archive into compacted files,
+which keep their messages already parsed in the :mod:`irclog.codec` format.
+:class:`irclog.archive.Log` reads a compacted file instead of the raw log
+file when it has been made after the last change of the raw file.
+
+Compacted files are next to raw log files by default, or in a mirror tree
+(see :attr:`irclog.archive.Archive.compacted_root`). Channels are compacted
+in parallel worker processes. Logs which already have an up-to-date
+compacted file are skipped, so an interrupted run can just be run again.
+It can be run as a script:
+
+.. sourcecode:: console
+
+   $ python -m irclog.compact "/logs/<server>/<channel>.<date:%Y-%m-%d>.log"
+   Freenode #hongminhee: 365 logs, 21.2 MiB, 412220 messages
+   total: 365 logs, 21.2 MiB, 412220 messages in 9.87 s
+   throughput: 2.1 MiB/s, 41765 messages/s
+
+With ``--search-index``, it also indexes lines appended since the last run
+into the full-text search index (see :mod:`irclog.search`), which queries
+only read. Running it from cron keeps the index caught up.
+
+"""
+import os
+import sys
+import time
+import datetime
+import optparse
+import multiprocessing
+import irclog.codec
+import irclog.parser
+import irclog.archive
+
+
+def is_compacted(path, compacted):
+    """Returns ``True`` if ``compacted`` exists, has been made after the
+    last change of ``path``, and is of the current
+    :data:`irclog.codec.VERSION`.
+
+    :param path: a path of raw log file
+    :type path: :class:`basestring`
+    :param compacted: a path of compacted file
+    :type compacted: :class:`basestring`
+    :returns: ``True`` or ``False``
+
+    """
+    try:
+        if os.path.getmtime(compacted) <= os.path.getmtime(path):
+            return False
+        with open(compacted, "rb") as file:
+            head = file.read(len(irclog.codec.MAGIC) + 1)
+    except (OSError, IOError):
+        return False
+    return head == irclog.codec.MAGIC + chr(irclog.codec.VERSION)
+
+
+def compact_file(path, date, encoding, compacted):
+    """Parses a raw log file and writes its compacted file. The file is
+    written to a temporary file first and renamed, so an interrupted run
+    never leaves a broken compacted file.
+
+    :param path: a path of raw log file
+    :type path: :class:`basestring`
+    :param date: the date of the log
+    :type date: :class:`datetime.date`
+    :param encoding: the text encoding of the log. ``None`` means to detect
+                     it (see :func:`irclog.archive.detect_encoding()`)
+    :type encoding: :class:`basestring`
+    :param compacted: a path of compacted file
+    :type compacted: :class:`basestring`
+    :returns: a pair of ``(raw_bytes, number_of_messages)``
+
+    """
+    encoding = encoding or irclog.archive.detect_encoding(path)
+    with open(path, "rb") as file:
+        lines = irclog.parser.read_lines(file, encoding)
+        messages = list(irclog.parser.parse(lines, date, encoding, {}))
+    dirname = os.path.dirname(compacted)
+    if dirname and not os.path.isdir(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            # Another worker may have made it in the meantime.
+            if not os.path.isdir(dirname):
+                raise
+    temp_filename = "{0}.{1}.tmp".format(compacted, os.getpid())
+    with open(temp_filename, "wb") as file:
+        irclog.codec.dump(messages, file)
+    os.rename(temp_filename, compacted)
+    return os.path.getsize(path), len(messages)
+
+
+def _compact_channel(args):
+    keys, tasks = args
+    size = count = 0
+    for task in tasks:
+        file_size, file_count = compact_file(*task)
+        size += file_size
+        count += file_count
+    return keys, len(tasks), size, count
+
+
+def channel_tasks(archive, today=None, force=False):
+    """Lists the logs to compact for each channel. Only the logs of days
+    before ``today`` are compacted, since the log of today is still being
+    written.
+
+    :param archive: an archive
+    :type archive: :class:`irclog.archive.Archive`
+    :param today: the date of today. default is the local date
+    :type today: :class:`datetime.date`
+    :param force: compact logs again even if they are already compacted
+    :type force: :class:`bool`
+    :returns: pairs of ``(index_keys, tasks)``, where ``tasks`` are
+              arguments of :func:`compact_file()`
+
+    """
+    today = today or datetime.date.today()
+    for server in archive:
+        for channel in server:
+            tasks = []
+            for log in channel:
+                if log.date >= today:
+                    continue
+                path = log.path
+                if path is None:
+                    continue
+                compacted = archive.compacted_path(path)
+                if force or not is_compacted(path, compacted):
+                    tasks.append((path, log.date, channel.encoding, compacted))
+            if tasks:
+                yield channel.index_keys, tasks
+
+
+def compact_archive(archive, processes=None, today=None, force=False,
+                    stream=sys.stdout):
+    """Compacts the logs of past days in ``archive``. Channels are compacted
+    in parallel, and logs which are already compacted are skipped.
+
+    :param archive: an archive
+    :type archive: :class:`irclog.archive.Archive`
+    :param processes: the number of worker processes. default is the number
+                      of CPUs. when it is 1, logs are compacted in the
+                      current process
+    :type processes: :class:`int`
+    :param today: the date of today. default is the local date
+    :type today: :class:`datetime.date`
+    :param force: compact logs again even if they are already compacted
+    :type force: :class:`bool`
+    :param stream: the stream to report progress to. ``None`` means to
+                   report nothing
+    :returns: a tuple of ``(logs, raw_bytes, messages, seconds)``
+
+    """
+    started_at = time.time()
+    tasks = channel_tasks(archive, today, force)
+    logs = size = count = 0
+    if processes == 1:
+        results = (_compact_channel(task) for task in tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_compact_channel, tasks)
+    try:
+        for keys, channel_logs, channel_size, channel_count in results:
+            logs += channel_logs
+            size += channel_size
+            count += channel_count
+            if stream is not None:
+                print >> stream, "{0}: {1} logs, {2:.1f} MiB, " \
+                                 "{3} messages".format(
+                    " ".join(keys), channel_logs,
+                    channel_size / 1024.0 / 1024, channel_count
+                )
+    except:
+        if pool is not None:
+            pool.terminate()
+        raise
+    else:
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.join()
+    seconds = time.time() - started_at
+    if stream is not None:
+        rate = 1 / seconds if seconds else float("inf")
+        print >> stream, "total: {0} logs, {1:.1f} MiB, {2} messages " \
+                         "in {3:.2f} s".format(logs, size / 1024.0 / 1024,
+                                               count, seconds)
+        print >> stream, "throughput: {0:.1f} MiB/s, {1:.0f} messages/s" \
+                         .format(size * rate / 1024 / 1024, count * rate)
+    return logs, size, count, seconds
+
+
+def main(argv=sys.argv):
+    """The compaction script entry point.
+
+    :param argv: command line arguments
+    :type argv: :class:`list`
+
+    """
+    parser = optparse.OptionParser(usage="%prog [options] PATTERN")
+    parser.add_option("-m", "--mirror", metavar="DIR",
+                      help="write compacted files into a mirror tree under "
+                           "DIR instead of next to raw log files")
+    parser.add_option("-e", "--encoding",
+                      help="the text encoding of logs [default: detect]")
+    parser.add_option("-j", "--processes", type="int",
+                      help="the number of worker processes "
+                           "[default: the number of CPUs]")
+    parser.add_option("-f", "--force", action="store_true", default=False,
+                      help="compact logs which are already compacted again")
+    parser.add_option("-s", "--search-index", metavar="DIR",
+                      help="also update the full-text search index in DIR")
+    options, args = parser.parse_args(argv[1:])
+    if len(args) != 1:
+        parser.error("a filename pattern is required")
+    archive = irclog.archive.Archive(args[0], encoding=options.encoding,
+                                     compacted_root=options.mirror,
+                                     search_index_path=options.search_index)
+    compact_archive(archive, options.processes, force=options.force)
+    if archive.search_index is not None:
+        started_at = time.time()
+        count = archive.search_index.update_archive(archive)
+        archive.search_index.close()
+        print "search index: {0} lines in {1:.2f} s".format(
+            count, time.time() - started_at
+        )
+
+
+if __name__ == "__main__":
+    main()
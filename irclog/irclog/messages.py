@@ -33,6 +33,17 @@ It provides a hierarchy of IRC log message types.
 Objects
 -------
 
+.. data:: MESSAGE_TYPES
+
+   The :class:`tuple` of concrete message types. Their indices are used as
+   kind codes of messages, so new types have to be appended to the end.
+
+.. data:: IDENTIFIER_FIELDS
+
+   The names of :attr:`~BaseMessage.FIELDS` which are nicks or channels.
+   These can be interned. Idents are not, since nearly every ``user@host``
+   is distinct and sharing them saves nothing.
+
 """
 import datetime
 
@@ -48,9 +59,16 @@ class BaseMessage(object):
 
        The naive :class:`datetime.datetime` logged.
 
+    .. data:: FIELDS
+
+       The names of attributes the constructor takes after ``messaged_at``,
+       in order. ``type(m)(m.messaged_at, *(getattr(m, f) for f in
+       m.FIELDS))`` makes a copy of a message ``m``.
+
     """
 
     __slots__ = "messaged_at",
+    FIELDS = ()
 
     def __init__(self, messaged_at):
         if not isinstance(messaged_at, datetime.datetime):
@@ -82,6 +100,7 @@ class Message(BaseMessage):
     """
 
     __slots__ = "nick", "line"
+    FIELDS = "nick", "line"
 
     def __init__(self, messaged_at, nick, line):
         BaseMessage.__init__(self, messaged_at)
@@ -134,6 +153,7 @@ class NoticeMessage(Message):
     """
 
     __slots__ = "channel",
+    FIELDS = "nick", "line", "channel"
 
     def __init__(self, messaged_at, nick, line, channel):
         Message.__init__(self, messaged_at, nick, line)
@@ -156,6 +176,7 @@ class BaseNickMessage(BaseMessage):
     """
 
     __slots__ = "to",
+    FIELDS = "to",
 
     def __init__(self, messaged_at, to):
         BaseMessage.__init__(self, messaged_at)
@@ -179,6 +200,7 @@ class NickMessage(BaseNickMessage):
     """
 
     __slots__ = "from_",
+    FIELDS = "from_", "to"
 
     def __init__(self, messaged_at, from_, to):
         BaseNickMessage.__init__(self, messaged_at, to)
@@ -224,6 +246,7 @@ class JoinMessage(BaseMessage):
     """
 
     __slots__ = "nick", "ident", "channel"
+    FIELDS = "nick", "ident", "channel"
 
     def __init__(self, messaged_at, nick, ident, channel):
         BaseMessage.__init__(self, messaged_at)
@@ -266,6 +289,7 @@ class ModeMessage(BaseMessage):
     """
 
     __slots__ = "server", "channel", "modelist", "nick"
+    FIELDS = "server", "channel", "modelist", "nick"
 
     def __init__(self, messaged_at, server, channel, modelist, nick):
         BaseMessage.__init__(self, messaged_at)
@@ -308,6 +332,7 @@ class PartMessage(BaseMessage):
     """
 
     __slots__ = "nick", "ident", "channel", "reason"
+    FIELDS = "nick", "ident", "channel", "reason"
 
     def __init__(self, messaged_at, nick, ident, channel, reason):
         BaseMessage.__init__(self, messaged_at)
@@ -343,6 +368,7 @@ class QuitMessage(BaseMessage):
     """
 
     __slots__ = "nick", "ident", "reason"
+    FIELDS = "nick", "ident", "reason"
 
     def __init__(self, messaged_at, nick, ident, reason):
         BaseMessage.__init__(self, messaged_at)
@@ -383,6 +409,7 @@ class KickMessage(BaseMessage):
     """
 
     __slots__ = "nick", "channel", "by", "reason",
+    FIELDS = "nick", "channel", "by", "reason"
 
     def __init__(self, messaged_at, nick, channel, by, reason):
         BaseMessage.__init__(self, messaged_at)
@@ -414,6 +441,7 @@ class BaseTopicMessage(BaseMessage):
     """
 
     __slots__ = "nick", "channel"
+    FIELDS = "nick", "channel"
 
     def __init__(self, messaged_at, nick, channel):
         BaseMessage.__init__(self, messaged_at)
@@ -441,6 +469,7 @@ class TopicMessage(BaseTopicMessage):
     """
 
     __slots__ = "topic"
+    FIELDS = "nick", "channel", "topic"
 
     def __init__(self, messaged_at, nick, channel, topic):
         BaseTopicMessage.__init__(self, messaged_at, nick, channel)
@@ -459,3 +488,8 @@ class NoTopicMessage(BaseTopicMessage):
 
     """
 
+
+MESSAGE_TYPES = (PublicMessage, ActionMessage, NoticeMessage, NickMessage,
+                 SelfNickMessage, JoinMessage, ModeMessage, PartMessage,
+                 QuitMessage, KickMessage, TopicMessage, NoTopicMessage)
+IDENTIFIER_FIELDS = frozenset(["nick", "from_", "to", "channel", "by"])
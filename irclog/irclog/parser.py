@@ -17,11 +17,77 @@ to message objects in :mod:`irclog.messages` module.
 
       .. _Kang Seonghoon: http://mearie.org/
 
+.. data:: PUBMSG_PATTERN
+          ACTMSG_PATTERN
+          NOTICEMSG_PATTERN
+          EVENT_PATTERN
+
+   The smaller :mod:`re` patterns :func:`tokenize()` tries first, each of
+   them being the alternative of :data:`PATTERN` for one kind of line.
+   They have the same groups as the alternative of :data:`PATTERN`.
+
+.. data:: BLOCK_SIZE
+
+   The default number of bytes :func:`read_lines()` decodes at once.
+
+.. data:: CHUNK_SIZE
+
+   The default number of bytes :func:`parse_files()` gives to a worker
+   process at once.
+
+.. data:: RULES
+
+   The :class:`dict` of registered parser functions by their rule names.
+   See :func:`parser()`.
+
+.. data:: RULE_GROUPS
+
+   The :class:`dict` of the groups each rule takes, in the order of the
+   parameters of its parser function.
+
+.. data:: IDENTIFIER_SUFFIXES
+
+   The suffixes of the names of groups which are nicks or channels. These
+   identifiers are interned (see :func:`tokens()`). Idents are not, since
+   nearly every ``user@host`` is distinct.
+
+.. data:: RULE_INTERNS
+
+   The :class:`dict` of the indices of the identifier groups each rule
+   takes, not counting ``when``.
+
+.. data:: RULE_NICKS
+
+   The :class:`dict` of the index of the group each rule takes as the nick
+   who made the message, not counting ``when``, or ``None``. It is the
+   ``nick`` of messages, and the ``from_`` of
+   :class:`irclog.messages.NickMessage`.
+
+.. data:: HEAD_RULES
+
+   The :class:`dict` of the rules a line may be, by what its message starts
+   with after the timestamp. :func:`tokens()` skips lines by it without
+   decoding them.
+
+.. data:: RULE_TYPES
+
+   The :class:`dict` of message types by the parser functions which make
+   them of their groups as they are, i.e. ``cls(when, *groups)``.
+   :func:`parse_batch()` fills these rules into a batch without calling the
+   functions. A function replaced in :data:`RULES` is not in it, so it is
+   always called.
+
 """
+import os
 import re
+import mmap
+import inspect
 import datetime
+import multiprocessing
 import chardet
+import irclog.codec
 import irclog.messages
+import irclog.columnar
 
 
 PATTERN = re.compile(r"""
@@ -98,44 +164,732 @@ PATTERN = re.compile(r"""
     ) $
 """, re.VERBOSE | re.IGNORECASE)
 
+PUBMSG_PATTERN = re.compile(r"""
+    ^ (?P<when>\d\d:\d\d(?::\d\d)?)[ ]
+    (?P<pubmsg>
+        <[ +@~]?(?P<pubnick>.*?)>[ ](?P<publine>.*?)
+    ) $
+""", re.VERBOSE | re.IGNORECASE)
+
+ACTMSG_PATTERN = re.compile(r"""
+    ^ (?P<when>\d\d:\d\d(?::\d\d)?)[ ]
+    (?P<actmsg>
+        [ ]\*[ ](?P<actnick>.*?)[ ](?P<actline>.*?)
+    ) $
+""", re.VERBOSE | re.IGNORECASE)
+
+NOTICEMSG_PATTERN = re.compile(r"""
+    ^ (?P<when>\d\d:\d\d(?::\d\d)?)[ ]
+    (?P<noticemsg>
+        -(?P<noticenick>.*?):
+        (?:[+@~ ])?(?P<noticechan>.*?)
+        -[ ](?P<noticeline>.*?)
+    ) $
+""", re.VERBOSE | re.IGNORECASE)
+
+EVENT_PATTERN = re.compile(r"""
+    ^ (?P<when>\d\d:\d\d(?::\d\d)?)[ ]
+    -!- [ ](?:
+        (?P<ignorable>
+            Irssi:[ ] .* |
+            [<;]/Netsplit[ ] .*   # XXX
+        ) |
+        (?P<nickmsg>
+            (?P<nickfrom>.*?)[ ]is[ ]now[ ]known[ ]as[ ](?P<nickto>.*?)
+        ) |
+        (?P<selfnickmsg>
+            You're[ ]now[ ]known[ ]as[ ](?P<selfnickto>.*?)
+        ) |
+        (?P<joinmsg>
+            (?P<joinnick>.*?)[ ]\[(?P<joinident>.*?)\][ ]
+            has[ ]joined[ ](?P<joinchan>.*?)
+        ) |
+        (?P<modemsg>
+            (?:mode|(?P<modeserver></ServerMode))
+            (?P<modechan>.*?)[ ]\[(?P<modelist>.*?)\][ ]
+            by[ ](?P<modenick>.*?)
+        ) |
+        (?P<partmsg>
+            (?P<partnick>.*?)[ ]
+            \[(?P<partident>.*?)\][ ]
+            has[ ]left[ ](?P<partchan>.*?)[ ]
+            \[(?P<partreason>.*?)/\]
+        ) |
+        (?P<quitmsg>
+            (?P<quitnick>.*?)[ ] \[(?P<quitident>.*?)\][ ]
+            has[ ]quit[ ]\[(?P<quitreason>.*?)\]
+        ) |
+        (?P<kickmsg>
+            (?P<kicknick>.*?)[ ]
+            was[ ]kicked[ ]from[ ](?P<kickchan>.*?)[ ]
+            by[ ](?P<kickby>.*?)[ ] \[(?P<kickreason>.*?)\]
+        ) |
+        (?P<topicmsg>
+            (?P<topicnick>.*?)[ ]changed[ ]
+            the[ ]topic[ ]of[ ](?P<topicchan>.*?)
+            [ ]to:[ ](?P<topicline>.*?)
+        ) |
+        (?P<notopicmsg>
+            Topic[ ]unset[ ]by[ ](?P<notopicnick>.*?)
+            [ ]on[ ](?P<notopicchan>.*?)
+        ) |
+    ) $
+""", re.VERBOSE | re.IGNORECASE)
+
+BLOCK_SIZE = 1024 * 1024
+CHUNK_SIZE = 4 * 1024 * 1024
+
+TWO_DIGITS = frozenset("{0:02d}".format(i) for i in xrange(100))
+
+IDENTIFIER_SUFFIXES = "nick", "chan", "from", "to", "by"
+
 RULES = {}
+RULE_GROUPS = {}
+RULE_INTERNS = {}
+RULE_NICKS = {}
+RULE_TYPES = {}
 
+EVENT_RULES = frozenset(["nickmsg", "selfnickmsg", "joinmsg", "modemsg",
+                         "partmsg", "quitmsg", "kickmsg", "topicmsg",
+                         "notopicmsg"])
+HEAD_RULES = {"<": frozenset(["pubmsg"]),
+              " ": frozenset(["actmsg"]),
+              "-": frozenset(["noticemsg"]),
+              # PATTERN takes a line of -!- for a notice if no event does.
+              "-!- ": EVENT_RULES | frozenset(["noticemsg"])}
 
-def parse(lines, date=None, encoding="utf-8"):
+
+def parse(lines, date=None, encoding="utf-8", interns=None, kinds=None,
+          nicks=None):
     """Transforms lines of log to message objects in :mod:`irclog.messages`
     module.
 
-    :param lines: lines of code
+    :param lines: lines of code. lines already decoded to :class:`unicode`
+                  are taken as they are
     :type lines: iterable object, file object
     :param date: a date of the log. default is today
     :type date: :class:`datetime.date`
     :param encoding: a text encoding. default is ``"utf-8"``
+    :param interns: the table of identifiers to share. see :func:`tokens()`
+    :type interns: :class:`dict`
+    :param kinds: message types to take. default is ``None`` which means
+                  all types
+    :type kinds: :class:`type`, :class:`tuple`
+    :param nicks: nicks whose messages to take, case-insensitively. see
+                  :data:`RULE_NICKS`. default is ``None`` which means all
+                  nicks
+    :type nicks: iterable object
     :returns: a list of :class:`irclog.messages.BaseMessage` instances
 
+    Lines that ``encoding`` fails to decode are decoded with an encoding
+    :func:`chardet.detect()` guesses. Guesses are remembered and tried first
+    for the following lines, so :mod:`chardet` runs only a few times even
+    if ``encoding`` is wrong for the whole log.
+
+    .. note:: This is exactly a generator function.
+
+    """
+    rules = None if kinds is None else kind_rules(kinds)
+    for rule, when, groups in tokens(lines, date, encoding, interns,
+                                     rules, nicks):
+        message = RULES[rule](when, *groups)
+        if kinds is None or isinstance(message, kinds):
+            yield message
+
+
+def kind_rules(kinds):
+    """Finds the rules which may make messages of ``kinds``. Rules not in
+    :data:`RULE_TYPES` are always included, since what they make is not
+    known in advance.
+
+    :param kinds: message types
+    :type kinds: :class:`type`, :class:`tuple`
+    :returns: a :class:`frozenset` of rule names
+
+    """
+    return frozenset(rule for rule, function in RULES.iteritems()
+                     if function not in RULE_TYPES or
+                        issubclass(RULE_TYPES[function], kinds))
+
+
+def tokens(lines, date=None, encoding="utf-8", interns=None, rules=None,
+           nicks=None):
+    """Decodes and tokenizes lines of log without making message objects.
+    It is the first half of :func:`parse()`, which calls the parser function
+    of each rule on what this yields.
+
+    :param lines: lines of code. lines already decoded to :class:`unicode`
+                  are taken as they are
+    :type lines: iterable object, file object
+    :param date: a date of the log. default is today
+    :type date: :class:`datetime.date`
+    :param encoding: a text encoding. default is ``"utf-8"``
+    :param interns: the table of identifiers to share. identifier groups
+                    (see :data:`RULE_INTERNS`) equal to a key are replaced
+                    by its value, and new ones are added to it, so the same
+                    nick or channel is one object in all messages made with
+                    the table. default is ``None`` which means not to intern
+    :type interns: :class:`dict`
+    :param rules: rule names to take. default is ``None`` which means all
+                  rules
+    :type rules: :class:`frozenset`
+    :param nicks: nicks whose messages to take, case-insensitively. see
+                  :data:`RULE_NICKS`. default is ``None`` which means all
+                  nicks
+    :type nicks: iterable object
+    :returns: ``(rule, messaged_at, groups)`` triples, where ``groups``
+              are the rest of the groups the rule takes after ``when``
+
+    A log has many lines in the same minute or second, so ``messaged_at``
+    is made once for each distinct ``when`` and shared by its lines.
+    :class:`datetime.datetime` is immutable, so sharing it is safe.
+
+    When ``rules`` or ``nicks`` are given, lines are first checked by what
+    follows their timestamps (see :data:`HEAD_RULES`), and the nicks of
+    public messages are decoded and compared alone, so lines which cannot
+    be taken are skipped before they are decoded or tokenized.
+
     .. note:: This is exactly a generator function.
 
     """
     date = date or datetime.date.today()
+    fallbacks = []
+    times = {}
+    filtered = rules is not None or nicks is not None
+    if nicks is not None:
+        nicks = frozenset(nick.lower() for nick in nicks)
     for line in lines:
-        try:
-            line = line.decode(encoding)
-        except UnicodeDecodeError:
-            enc = chardet.detect(line).get("encoding") or "utf-8"
-            line = line.decode(enc, "replace")
-        match = PATTERN.match(line.strip())
-        if not match:
+        if filtered and not _prefilter(line, encoding, rules, nicks):
             continue
-        for group_name, function in RULES.iteritems():
-            if match.group(group_name):
-                groups = match.groupdict()
-                time = datetime.time(*map(int, groups["when"].split(":")))
-                groups["when"] = datetime.datetime.combine(date, time)
-                yield function(**groups)
+        if not isinstance(line, unicode):
+            try:
+                line = line.decode(encoding)
+            except UnicodeDecodeError:
+                for enc in fallbacks:
+                    try:
+                        line = line.decode(enc)
+                        break
+                    except UnicodeDecodeError:
+                        continue
+                else:
+                    enc = chardet.detect(line).get("encoding") or "utf-8"
+                    if enc not in fallbacks:
+                        fallbacks.append(enc)
+                    line = line.decode(enc, "replace")
+        token = tokenize(line.strip())
+        if not token:
+            continue
+        rule, groups = token
+        if filtered:
+            if rules is not None and rule not in rules:
+                continue
+            if nicks is not None:
+                index = RULE_NICKS.get(rule)
+                nick = None if index is None else groups[index + 1]
+                if nick is None or nick.lower() not in nicks:
+                    continue
+        try:
+            when = times[groups[0]]
+        except KeyError:
+            time = datetime.time(*map(int, groups[0].split(":")))
+            when = times[groups[0]] = datetime.datetime.combine(date, time)
+        groups = groups[1:]
+        if interns is not None:
+            indices = RULE_INTERNS.get(rule)
+            if indices:
+                groups = list(groups)
+                for i in indices:
+                    group = groups[i]
+                    groups[i] = interns.setdefault(group, group)
+        yield rule, when, groups
+
+
+def _prefilter(line, encoding, rules, nicks):
+    """Tells if ``line`` may be taken by ``rules`` and ``nicks`` only by
+    looking at it, before it is decoded. See :func:`tokens()`.
+
+    """
+    if line[:1].isspace():
+        line = line.lstrip()
+    if line[5:6] == " ":
+        offset = 6
+    elif line[5:6] == ":" and line[8:9] == " ":
+        offset = 9
+    else:
+        # Lines without timestamps are never messages.
+        return False
+    head = line[offset:offset + 1]
+    if head == "-" and line[offset:offset + 4] == "-!- ":
+        head = "-!- "
+    if rules is not None:
+        candidates = HEAD_RULES.get(head)
+        if candidates is not None and not candidates & rules:
+            return False
+    if nicks is not None and head == "<":
+        # The same as tokenize() takes the nick of a public message.
+        if line[offset + 1:offset + 2] in " +@~":
+            start = offset + 2
+        else:
+            start = offset + 1
+        end = line.find("> ", start)
+        if end >= 0:
+            nick = line[start:end]
+            if not isinstance(nick, unicode):
+                try:
+                    nick = nick.decode(encoding)
+                except UnicodeDecodeError:
+                    return True
+            return nick.lower() in nicks
+    return True
+
+
+def parse_batch(lines, date=None, encoding="utf-8", batch=None,
+                interns=None):
+    """Parses lines of log into a :class:`irclog.columnar.MessageBatch`
+    instead of a message object per line. Rules in :data:`RULE_TYPES` are
+    filled into the batch directly, and the rest are parsed by their parser
+    functions first.
+
+    :param lines: lines of code. see :func:`parse()`
+    :type lines: iterable object, file object
+    :param date: a date of the log. default is today
+    :type date: :class:`datetime.date`
+    :param encoding: a text encoding. default is ``"utf-8"``
+    :param batch: a batch to append messages to. default is a new one
+    :type batch: :class:`irclog.columnar.MessageBatch`
+    :param interns: the table of identifiers to share. see :func:`tokens()`
+    :type interns: :class:`dict`
+    :returns: the batch
+
+    """
+    if batch is None:
+        batch = irclog.columnar.MessageBatch()
+    append, append_row = batch.append, batch.append_row
+    for rule, when, groups in tokens(lines, date, encoding, interns):
+        function = RULES[rule]
+        cls = RULE_TYPES.get(function)
+        if cls is None:
+            append(function(when, *groups))
+        else:
+            append_row(cls, when, groups)
+    return batch
+
+
+def parse_line(line, date=None, encoding="utf-8"):
+    """Transforms a line of log to a message object. See also
+    :func:`parse()`.
+
+    :param line: a line of log
+    :type line: :class:`basestring`
+    :param date: a date of the log. default is today
+    :type date: :class:`datetime.date`
+    :param encoding: a text encoding. default is ``"utf-8"``
+    :returns: a :class:`irclog.messages.BaseMessage` instance, or ``None``
+              if the line has no message
+
+    """
+    for message in parse((line,), date, encoding):
+        return message
+
+
+def split_lines(block, encoding="utf-8"):
+    r"""Decodes a block of bytes at once and splits it into lines. If the
+    block fails to decode, it is split into undecoded lines instead, and
+    :func:`parse()` decodes them line by line.
+
+    .. sourcecode:: pycon
+
+       >>> split_lines("10:01 <a> \xc3\xa6\n10:02 <b> c\n")
+       [u'10:01 <a> \xe6', u'10:02 <b> c']
+       >>> split_lines("10:01 <a> \xe6\n10:02 <b> c")
+       ['10:01 <a> \xe6', '10:02 <b> c']
+
+    :param block: a block of lines
+    :type block: :class:`str`
+    :param encoding: a text encoding. default is ``"utf-8"``
+    :returns: a :class:`list` of lines
+
+    """
+    try:
+        lines = block.decode(encoding).split(u"\n")
+    except UnicodeDecodeError:
+        lines = block.split("\n")
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def read_lines(file, encoding="utf-8", block_size=BLOCK_SIZE):
+    """Reads lines from a log file in blocks of about ``block_size`` bytes,
+    decoding each block at once. The file is memory-mapped if possible.
+    Its lines can be given to :func:`parse()`.
+
+    :param file: a log file opened in binary mode
+    :type file: file object
+    :param encoding: a text encoding. default is ``"utf-8"``
+    :param block_size: the size of a block in bytes
+    :type block_size: :class:`int`
+    :returns: lines, mostly :class:`unicode` (see :func:`split_lines()`)
+
+    .. note:: This is exactly a generator function.
+
+    """
+    try:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, ValueError, EnvironmentError):
+        # Not a real file, or an empty one which cannot be mapped.
+        buffer = file.read()
+    try:
+        size = len(buffer)
+        start = 0
+        while start < size:
+            end = buffer.find("\n", start + block_size)
+            end = size if end < 0 else end + 1
+            for line in split_lines(buffer[start:end], encoding):
+                yield line
+            start = end
+    finally:
+        if isinstance(buffer, mmap.mmap):
+            buffer.close()
+
+
+class OffsetLines(object):
+    r"""Reads lines from a log file in blocks as :func:`read_lines()` does,
+    from the byte offset ``start``, and keeps track of where each line is
+    in the file. While :func:`parse()` or :func:`tokens()` handles a line
+    of it, :attr:`offset` is where the line starts. Only lines terminated by
+    a newline are read: a last line which is not terminated yet is left.
+
+    .. sourcecode:: pycon
+
+       >>> import StringIO
+       >>> lines = OffsetLines(StringIO.StringIO(
+       ...     "10:01 <a> \xc3\xa6\n--- Day changed\n10:02 <b> c\n10:03 <c"
+       ... ))
+       >>> for message in parse(lines, datetime.date(2010, 8, 4)):
+       ...     print lines.offset, message.nick
+       0 a
+       29 b
+       >>> lines.end
+       41
+
+    :param file: a log file opened in binary mode
+    :type file: file object
+    :param encoding: a text encoding. default is ``"utf-8"``
+    :param start: the byte offset to start reading from
+    :type start: :class:`int`
+    :param block_size: the size of a block in bytes
+    :type block_size: :class:`int`
+
+
+    .. attribute:: offset
+
+       The byte offset of the line last read.
+
+    .. attribute:: end
+
+       The byte offset just after the line last read, which is where the
+       next reading starts.
+
+    """
+
+    __slots__ = "file", "encoding", "block_size", "offset", "end"
+
+    def __init__(self, file, encoding="utf-8", start=0,
+                 block_size=BLOCK_SIZE):
+        self.file = file
+        self.encoding = encoding
+        self.block_size = block_size
+        self.offset = self.end = start
+
+    def __iter__(self):
+        file = self.file
+        file.seek(self.end)
+        while True:
+            block = file.read(self.block_size)
+            if not block.endswith("\n"):
+                block += file.readline()
+            last = not block.endswith("\n")
+            if last:
+                block = block[:block.rfind("\n") + 1]
+            # Lines are split the same way in bytes and in text, so the
+            # bytes of each line tell its length.
+            for raw_line, line in zip(block.split("\n"),
+                                      split_lines(block, self.encoding)):
+                self.offset = self.end
+                self.end += len(raw_line) + 1
+                yield line
+            if last:
                 break
 
 
+def split_file(filename, chunk_size=CHUNK_SIZE):
+    """Splits a file into line-aligned chunks of about ``chunk_size`` bytes.
+
+    :param filename: a filename of log
+    :type filename: :class:`basestring`
+    :param chunk_size: the size of a chunk in bytes
+    :type chunk_size: :class:`int`
+    :returns: ``(start, end)`` byte offsets of chunks
+
+    """
+    size = os.path.getsize(filename)
+    with open(filename, "rb") as file:
+        start = 0
+        while start < size:
+            file.seek(start + chunk_size)
+            file.readline()
+            end = min(file.tell(), size)
+            yield start, end
+            start = end
+
+
+def parse_chunk(filename, start, end, date=None, encoding="utf-8"):
+    """Parses a chunk of a file. See also :func:`split_file()`.
+
+    :param filename: a filename of log
+    :type filename: :class:`basestring`
+    :param start: the byte offset the chunk starts at
+    :type start: :class:`int`
+    :param end: the byte offset the chunk ends at
+    :type end: :class:`int`
+    :param date: a date of the log. default is today
+    :type date: :class:`datetime.date`
+    :param encoding: a text encoding. default is ``"utf-8"``
+    :returns: a :class:`list` of :class:`irclog.messages.BaseMessage`
+              instances
+
+    """
+    with open(filename, "rb") as file:
+        file.seek(start)
+        lines = split_lines(file.read(end - start), encoding)
+    # Identifiers interned in a chunk stay shared after the messages are
+    # pickled to the parent process.
+    return list(parse(lines, date, encoding, {}))
+
+
+def encode_chunk(filename, start, end, date=None, encoding="utf-8"):
+    """Parses a chunk of a file into the binary format of
+    :mod:`irclog.codec`. Rules in :data:`RULE_TYPES` are encoded from their
+    groups as they are, without making message objects.
+
+    :param filename: a filename of log
+    :type filename: :class:`basestring`
+    :param start: the byte offset the chunk starts at
+    :type start: :class:`int`
+    :param end: the byte offset the chunk ends at
+    :type end: :class:`int`
+    :param date: a date of the log. default is today
+    :type date: :class:`datetime.date`
+    :param encoding: a text encoding. default is ``"utf-8"``
+    :returns: an encoded form
+    :raises KeyError: when a parser function makes a message of a type
+                      :mod:`irclog.codec` does not know
+
+    """
+    with open(filename, "rb") as file:
+        file.seek(start)
+        lines = split_lines(file.read(end - start), encoding)
+    def rows():
+        for rule, when, groups in tokens(lines, date, encoding):
+            function = RULES[rule]
+            cls = RULE_TYPES.get(function)
+            if cls is None:
+                message = function(when, *groups)
+                yield (type(message), message.messaged_at,
+                       [getattr(message, name) for name in message.FIELDS])
+            else:
+                yield cls, when, groups
+    return irclog.codec.encode_rows(rows())
+
+
+def _parse_chunk(args):
+    # Message objects take long to pickle and unpickle, so a chunk is sent
+    # to the parent process in the compact form of irclog.codec instead.
+    try:
+        return encode_chunk(*args)
+    except KeyError:
+        return parse_chunk(*args)
+
+
+def parse_chunks(files, processes=None, chunk_size=CHUNK_SIZE):
+    """Parses log files in worker processes, and yields the messages of
+    each chunk at once. Files are split into line-aligned chunks of about
+    ``chunk_size`` bytes, and chunks are parsed in parallel. Chunks are
+    yielded in the original order.
+
+    Workers send chunks back in the binary format of :mod:`irclog.codec`,
+    and they are yielded as :class:`irclog.codec.EncodedMessages`, which
+    decode each message only when it is accessed. So what the current
+    process does for a chunk is up to the caller, e.g. taking only its
+    length or a few of its messages.
+
+    :param files: ``(filename, date)`` or ``(filename, date, encoding)``
+                  tuples
+    :type files: iterable object
+    :param processes: the number of worker processes. default is the number
+                      of CPUs. when it is 1, files are parsed in the current
+                      process, and chunks are :class:`list` of messages
+    :type processes: :class:`int`
+    :param chunk_size: the size of a chunk in bytes
+    :type chunk_size: :class:`int`
+    :returns: sequences of :class:`irclog.messages.BaseMessage` instances
+
+    .. note:: This is exactly a generator function.
+
+    """
+    def chunks():
+        for file in files:
+            filename, args = file[0], tuple(file[1:])
+            for start, end in split_file(filename, chunk_size):
+                yield (filename, start, end) + args
+    tasks = chunks()
+    if processes == 1:
+        for task in tasks:
+            yield parse_chunk(*task)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for messages in pool.imap(_parse_chunk, tasks):
+            if isinstance(messages, str):
+                messages = irclog.codec.EncodedMessages(messages)
+            yield messages
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+
+def parse_files(files, processes=None, chunk_size=CHUNK_SIZE):
+    """Parses log files in worker processes. Messages are yielded in the
+    original order, as if the files were given to :func:`parse()` one by
+    one. Every message is decoded in the current process; callers which
+    need only some of them can take chunks from :func:`parse_chunks()`
+    instead.
+
+    :param files: ``(filename, date)`` or ``(filename, date, encoding)``
+                  tuples
+    :type files: iterable object
+    :param processes: the number of worker processes. default is the number
+                      of CPUs. when it is 1, files are parsed in the current
+                      process
+    :type processes: :class:`int`
+    :param chunk_size: the size of a chunk in bytes
+    :type chunk_size: :class:`int`
+    :returns: :class:`irclog.messages.BaseMessage` instances
+
+    .. note:: This is exactly a generator function.
+
+    """
+    for messages in parse_chunks(files, processes, chunk_size):
+        for message in messages:
+            yield message
+
+
+def tokenize(line):
+    """Matches a stripped line of log. The kind of line is classified by
+    the first characters after its timestamp, and then only the cheapest
+    way for the kind is tried: plain string splitting for ``<nick>``, and
+    the smaller patterns e.g. :data:`ACTMSG_PATTERN` for the rest. Lines
+    that none of them take fall back to :data:`PATTERN`, so it always
+    gives exactly what :data:`PATTERN` gives.
+
+    .. sourcecode:: pycon
+
+       >>> tokenize(u"10:01 <@DrSlem> hmmm")
+       ('pubmsg', (u'10:01', u'DrSlem', u'hmmm'))
+       >>> tokenize(u"--- Day changed Mon Aug 02 2010")
+
+    It gives the same as :data:`PATTERN` for every kind of line:
+
+    .. sourcecode:: pycon
+
+       >>> def match(line):
+       ...     m = PATTERN.match(line)
+       ...     if m and m.lastgroup in RULE_GROUPS:
+       ...         return m.lastgroup, m.group(*RULE_GROUPS[m.lastgroup])
+       >>> corpus = [
+       ...     u"10:01 <@DrSlem> hmmm, internettet mitt er treigt i dag",
+       ...     u"10:02 < vrakrav_> NISSELUER!",
+       ...     u"10:02 <+_neon_> <runehol> said> this",
+       ...     u"10:03:12 <Skuggen> JULEKALENDER!",
+       ...     u"10:03 <runehol>",
+       ...     u"10:04  * daven rages",
+       ...     u"10:04:05  * daven",
+       ...     u"10:04 -daven:#rageit- POSTKASSE!",
+       ...     u"10:04:05 -daven:@#rageit- POSTKASSE!",
+       ...     u"10:05 -!- hong [~hong@example.com] has joined #rageit",
+       ...     u"10:05 -!- hong is now known as hongminhee",
+       ...     u"10:05:59 -!- You're now known as DrSlem",
+       ...     u"10:06 -!- mode/#rageit [+o hongminhee] by DrSlem",
+       ...     u"10:06 -!- ServerMode/#rageit [+nt] by irc.example.com",
+       ...     u"10:06 -!- Irssi: Join to #rageit was synced in 1 secs",
+       ...     u"10:07 -!- hongminhee [~hong@example.com] has quit [Quit: bye]",
+       ...     u"10:07:30 -!- hong [~hong@example.com] has left #rageit [bye/]",
+       ...     u"10:08 -!- hong was kicked from #rageit by DrSlem [rage]",
+       ...     u"10:08 -!- DrSlem changed the topic of #rageit to: RAGE",
+       ...     u"10:08 -!- Topic unset by DrSlem on #rageit",
+       ...     u"--- Log opened Sun Aug 01 00:00:01 2010",
+       ...     u"--- Day changed Mon Aug 02 2010",
+       ...     u"10:09 hmmm",
+       ...     u"1:09 <a> b",
+       ... ]
+       >>> [line for line in corpus if tokenize(line) != match(line)]
+       []
+
+    :param line: a stripped line of log
+    :type line: :class:`basestring`
+    :returns: a pair of the rule name and the tuple of groups the rule takes
+              (see :data:`RULE_GROUPS`), or ``None`` if no rule takes the
+              line
+
+    """
+    if line[:2] in TWO_DIGITS and line[2:3] == ":" and line[3:5] in TWO_DIGITS:
+        if line[5:6] == " ":
+            offset = 6
+        elif line[5:6] == ":" and line[6:8] in TWO_DIGITS and line[8:9] == " ":
+            offset = 9
+        else:
+            offset = None
+    else:
+        offset = None
+    head = offset and line[offset:offset + 1]
+    if head == "<":
+        # The same as PUBMSG_PATTERN: an optional mode prefix, then the
+        # shortest nick followed by "> ".
+        if line[offset + 1:offset + 2] in " +@~":
+            start = offset + 2
+        else:
+            start = offset + 1
+        end = line.find("> ", start)
+        if end >= 0 and "\n" not in line:
+            return "pubmsg", (line[:offset - 1], line[start:end], line[end + 2:])
+        match = None
+    elif head == "-":
+        if line.startswith("-!- ", offset):
+            match = EVENT_PATTERN.match(line)
+        else:
+            match = NOTICEMSG_PATTERN.match(line)
+    elif head == " ":
+        match = ACTMSG_PATTERN.match(line)
+    else:
+        match = None
+    match = match or PATTERN.match(line)
+    if match:
+        # The group of the matched alternative is always the last one to be
+        # closed, so :attr:`~re.MatchObject.lastgroup` names the rule.
+        groups = RULE_GROUPS.get(match.lastgroup)
+        if groups:
+            return match.lastgroup, match.group(*groups)
+
+
 def parser(function):
-    """Registers a parser function.
+    """Registers a parser function. The function is named after the group of
+    :data:`PATTERN` it handles, and its positional parameters name the groups
+    it takes, the first one always being ``when``.
     
     :param function: a function parses to register
     :type function: callable object
@@ -144,82 +898,144 @@ def parser(function):
     """
     if not callable(function):
         raise TypeError("function must be callable")
+    groups = tuple(inspect.getargspec(function).args)
     RULES[function.__name__] = function
+    RULE_GROUPS[function.__name__] = groups
+    RULE_INTERNS[function.__name__] = tuple(
+        i for i, group in enumerate(groups[1:])
+        if group.endswith(IDENTIFIER_SUFFIXES)
+    )
+    RULE_NICKS[function.__name__] = next(
+        (i for i, group in enumerate(groups[1:])
+         if group.endswith("nick") or group == "nickfrom"),
+        None
+    )
     return function
 
 
 @parser
-def nickmsg(when, nickfrom, nickto, **_):
+def nickmsg(when, nickfrom, nickto):
     """Parses :class:`irclog.messages.NickMessage`."""
     return irclog.messages.NickMessage(when, nickfrom, nickto)
 
 
 @parser
-def selfnickmsg(when, selfnickto, **_):
+def selfnickmsg(when, selfnickto):
     """Parses :class:`irclog.messages.SelfNickMessage`."""
     return irclog.messages.SelfNickMessage(when, selfnickto)
 
 
 @parser
-def joinmsg(when, joinnick, joinident, joinchan, **_):
+def joinmsg(when, joinnick, joinident, joinchan):
     """Parses :class:`irclog.messages.JoinMessage`."""
     return irclog.messages.JoinMessage(when, joinnick, joinident, joinchan)
 
 
 @parser
-def modemsg(when, modeserver, modechan, modelist, modenick, **_):
+def modemsg(when, modeserver, modechan, modelist, modenick):
     """Parses :class:`irclog.messages.ModeMessage`."""
     return irclog.messages.ModeMessage(when, modeserver, modechan,
                                        modelist, modenick)
 
 
 @parser
-def partmsg(when, partnick, partident, partchan, partreason, **_):
-    """Parses :class:`irclog.messages.PartMessage`."""
-    return irclog.messages.PartMessage(partnick, partident,
+def partmsg(when, partnick, partident, partchan, partreason):
+    """Parses :class:`irclog.messages.PartMessage`.
+
+    .. sourcecode:: pycon
+
+       >>> message = parse_line("10:01 -!- hongminhee [~hm@example.com] "
+       ...                      "has left #langdev [bye/]",
+       ...                      datetime.date(2010, 8, 4))
+       >>> message.messaged_at
+       datetime.datetime(2010, 8, 4, 10, 1)
+       >>> message.nick, message.ident, message.channel, message.reason
+       (u'hongminhee', u'~hm@example.com', u'#langdev', u'bye')
+
+    """
+    return irclog.messages.PartMessage(when, partnick, partident,
                                        partchan, partreason)
 
 
 @parser
-def quitmsg(when, quitnick, quitident, quitreason, **_):
+def quitmsg(when, quitnick, quitident, quitreason):
     """Parses :class:`irclog.messages.QuitMessage`."""
     return irclog.messages.QuitMessage(when, quitnick, quitident, quitreason)
 
 
 @parser
-def kickmsg(when, kicknick, kickchan, kickby, kickreason, **_):
+def kickmsg(when, kicknick, kickchan, kickby, kickreason):
     """Parses :class:`irclog.messages.KickMessage`."""
     return irclog.messages.KickMessage(when, kicknick, kickchan,
                                        kickby, kickreason)
 
 
 @parser
-def topicmsg(when, topicnick, topicchan, topicline, **_):
+def topicmsg(when, topicnick, topicchan, topicline):
     """Parses :class:`irclog.messages.TopicMessage`."""
     return irclog.messages.TopicMessage(when, topicnick, topicchan, topicline)
 
 
 @parser
-def notopicmsg(when, notopicnick, notopicchan, **_):
-    """Parses :class:`irclog.messages.NoTopicMessage`."""
-    return irclog.messages.TopicMessage(when, notopicnick, notopicchan)
+def notopicmsg(when, notopicnick, notopicchan):
+    """Parses :class:`irclog.messages.NoTopicMessage`.
+
+    .. sourcecode:: pycon
+
+       >>> message = parse_line("10:02 -!- Topic unset by hongminhee "
+       ...                      "on #langdev", datetime.date(2010, 8, 4))
+       >>> type(message).__name__, message.messaged_at
+       ('NoTopicMessage', datetime.datetime(2010, 8, 4, 10, 2))
+       >>> message.nick, message.channel
+       (u'hongminhee', u'#langdev')
+
+    """
+    return irclog.messages.NoTopicMessage(when, notopicnick, notopicchan)
 
 
 @parser
-def pubmsg(when, pubnick, publine, **_):
+def pubmsg(when, pubnick, publine):
     """Parses :class:`irclog.messages.PublicMessage`."""
     return irclog.messages.PublicMessage(when, pubnick, publine)
 
 
 @parser
-def actmsg(when, actnick, actline, **_):
+def actmsg(when, actnick, actline):
     """Parses :class:`irclog.messages.ActionMessage`."""
     return irclog.messages.ActionMessage(when, actnick, actline)
 
 
 @parser
-def noticemsg(when, noticenick, noticechan, noticeline, **_):
-    """Parses :class:`irclog.messages.ActionMessage`."""
+def noticemsg(when, noticenick, noticeline, noticechan):
+    """Parses :class:`irclog.messages.NoticeMessage`. Its groups are in the
+    order of :attr:`irclog.messages.NoticeMessage.FIELDS`, as
+    :data:`RULE_TYPES` requires.
+
+    .. sourcecode:: pycon
+
+       >>> message = parse_line("10:04 -daven:#rageit- POSTKASSE!",
+       ...                      datetime.date(2010, 8, 4))
+       >>> message.messaged_at
+       datetime.datetime(2010, 8, 4, 10, 4)
+       >>> message.nick, message.line, message.channel
+       (u'daven', u'POSTKASSE!', u'#rageit')
+
+    """
     return irclog.messages.NoticeMessage(when, noticenick,
-                                         noticechan, noticeline)
+                                         noticeline, noticechan)
+
 
+RULE_TYPES.update({
+    nickmsg: irclog.messages.NickMessage,
+    selfnickmsg: irclog.messages.SelfNickMessage,
+    joinmsg: irclog.messages.JoinMessage,
+    modemsg: irclog.messages.ModeMessage,
+    partmsg: irclog.messages.PartMessage,
+    quitmsg: irclog.messages.QuitMessage,
+    kickmsg: irclog.messages.KickMessage,
+    topicmsg: irclog.messages.TopicMessage,
+    notopicmsg: irclog.messages.NoTopicMessage,
+    pubmsg: irclog.messages.PublicMessage,
+    actmsg: irclog.messages.ActionMessage,
+    noticemsg: irclog.messages.NoticeMessage
+})
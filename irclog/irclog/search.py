@@ -0,0 +1,423 @@
+""":mod:`irclog.search` --- Full-text search and nick index
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides an on-disk inverted index of the lines of
+:class:`irclog.messages.PublicMessage`, :class:`irclog.messages.ActionMessage`
+and :class:`irclog.messages.NoticeMessage`. It maps terms to the dates and
+byte offsets of the lines in log files, so matching messages can be read by
+seeking straight to them instead of parsing whole logs.
+
+It indexes nicks in the same way: the nicks of the messages above, of
+:class:`irclog.messages.JoinMessage`, :class:`irclog.messages.PartMessage`
+and :class:`irclog.messages.QuitMessage`, and both old and new nicks of
+:class:`irclog.messages.NickMessage`.
+
+Each channel has its own :mod:`anydbm` database in the index directory.
+A term has the list of dates it occurs on, and the byte offsets of its lines
+on each date under a key of its own, so an update rewrites only the
+postings of the dates it has read, and a query reads only the dates all of
+its terms occur on. Lines are indexed incrementally: the index remembers
+how many bytes of each log file it has read, and only lines appended after
+them are parsed on :meth:`SearchIndex.update()`.
+
+Queries open databases read-only and never write to them, so they can be
+made from many processes at once, e.g. mod_wsgi daemons. The index is
+updated by a separate step instead, such as :mod:`irclog.compact` with its
+``--search-index`` option run from cron:
+
+.. sourcecode:: python
+
+   archive = Archive("/logs/<server>/<channel>.<date:%Y-%m-%d>.log",
+                     search_index_path="/var/cache/irclog/search")
+   archive.search_index.update_archive(archive)
+   for log, message in archive["Freenode"]["#hongminhee"].search(u"rage"):
+       print log.date, message.nick, message.line
+   log, message = archive.last_seen(u"hongminhee")
+
+.. note::
+
+   An index should be updated by one process at a time.
+
+.. data:: TERM_PATTERN
+
+   The :mod:`re` pattern of terms.
+
+.. data:: NICK_MESSAGE_TYPES
+
+   The message types whose ``nick`` is indexed.
+
+.. data:: INDEXED_MESSAGE_TYPES
+
+   The message types which are indexed. Logs are parsed only for them.
+
+"""
+import os
+import re
+import array
+import urllib
+import anydbm
+import irclog.parser
+import irclog.messages
+
+
+TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+NICK_MESSAGE_TYPES = (irclog.messages.Message, irclog.messages.JoinMessage,
+                      irclog.messages.PartMessage, irclog.messages.QuitMessage)
+INDEXED_MESSAGE_TYPES = NICK_MESSAGE_TYPES + (irclog.messages.NickMessage,)
+
+
+def split_terms(text):
+    """Splits a text into the :class:`set` of lowercased terms.
+
+    .. sourcecode:: pycon
+
+       >>> sorted(split_terms(u"Rage, rage against the dying of the light"))
+       [u'against', u'dying', u'light', u'of', u'rage', u'the']
+
+    :param text: a text
+    :type text: :class:`unicode`
+    :returns: a :class:`set` of terms
+
+    """
+    return set(term.lower() for term in TERM_PATTERN.findall(text))
+
+
+def message_nicks(message):
+    """Returns nicks which ``message`` is made by.
+
+    :param message: a message
+    :type message: :class:`irclog.messages.BaseMessage`
+    :returns: a :class:`tuple` of nicks
+
+    """
+    if isinstance(message, irclog.messages.NickMessage):
+        return message.from_, message.to
+    elif isinstance(message, NICK_MESSAGE_TYPES):
+        return message.nick,
+    return ()
+
+
+def _stamp(filename):
+    """The sizes and modification times of the files of the :mod:`anydbm`
+    database ``filename``, whichever module has made it.
+
+    """
+    stamp = []
+    for suffix in "", ".db", ".dir", ".dat", ".pag":
+        try:
+            stat = os.stat(filename + suffix)
+        except OSError:
+            continue
+        stamp.append((suffix, stat.st_size, stat.st_mtime))
+    return tuple(stamp)
+
+
+def _date_key(key, ordinal):
+    """The database key of the offsets of ``key`` on the date ``ordinal``.
+    Terms and nicks never contain NUL, so it does not clash with them.
+
+    """
+    return "{0}\0{1}".format(key, ordinal)
+
+
+class SearchIndex(object):
+    """The full-text search index of an archive.
+
+    :param path: the directory the index is stored in. it is made if it
+                 does not exist
+    :type path: :class:`basestring`
+
+
+    .. attribute:: path
+
+       The directory the index is stored in.
+
+    .. data:: VERSION
+
+       The version of the database format. Databases of other versions are
+       emptied and indexed again.
+
+    """
+
+    VERSION = "4"
+
+    __slots__ = "path", "_databases"
+
+    def __init__(self, path):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.path = path
+        self._databases = {}
+
+    def database(self, channel, writable=False):
+        """Opens the database of ``channel``. Databases are kept open until
+        :meth:`close()`. A read-only database is opened again when its
+        files have changed since, so updates made by other processes are
+        seen.
+
+        :param channel: a channel
+        :type channel: :class:`irclog.archive.Channel`
+        :param writable: opens the database for updates, and makes it if
+                         it does not exist. default is ``False`` which
+                         means to open it read-only
+        :type writable: :class:`bool`
+        :returns: an :mod:`anydbm` database, or ``None`` if it is not
+                  ``writable`` and the channel has not been indexed
+
+        """
+        keys = channel.index_keys
+        dirname = os.path.join(self.path, urllib.quote(keys[0], safe=""))
+        filename = os.path.join(dirname, urllib.quote(keys[1], safe=""))
+        try:
+            database, opened_writable, stamp = self._databases[keys]
+        except KeyError:
+            pass
+        else:
+            if opened_writable or not writable and stamp == _stamp(filename):
+                return database
+            database.close()
+            del self._databases[keys]
+        if writable:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            stamp = None
+            database = anydbm.open(filename, "c")
+            if not database.has_key("v") or database["v"] != self.VERSION:
+                for key in database.keys():
+                    del database[key]
+                database["v"] = self.VERSION
+        else:
+            stamp = _stamp(filename)
+            try:
+                database = anydbm.open(filename, "r")
+            except anydbm.error:
+                return None
+            if not database.has_key("v") or database["v"] != self.VERSION:
+                database.close()
+                return None
+        self._databases[keys] = database, writable, stamp
+        return database
+
+    def update(self, log):
+        """Indexes lines appended to ``log`` since the last update. A log
+        file that has got shorter is indexed again from the start. A last
+        line which is not terminated yet is left for the next update.
+
+        :param log: a log to index
+        :type log: :class:`irclog.archive.Log`
+        :returns: the number of lines indexed
+
+        """
+        database = self.database(log.channel, writable=True)
+        postings = {}
+        count = self._read(database, log, postings)
+        self._write(database, postings)
+        return count
+
+    def update_channel(self, channel):
+        """Indexes lines appended to logs of ``channel`` since the last
+        update.
+
+        :param channel: a channel to index
+        :type channel: :class:`irclog.archive.Channel`
+        :returns: the number of lines indexed
+
+        """
+        database = self.database(channel, writable=True)
+        postings = {}
+        count = 0
+        for log in channel:
+            count += self._read(database, log, postings)
+        self._write(database, postings)
+        return count
+
+    def update_archive(self, archive):
+        """Indexes lines appended to all logs in ``archive`` since the last
+        update.
+
+        :param archive: an archive to index
+        :type archive: :class:`irclog.archive.Archive`
+        :returns: the number of lines indexed
+
+        """
+        return sum(self.update_channel(channel)
+                   for server in archive for channel in server)
+
+    def _read(self, database, log, postings):
+        """Parses lines of ``log`` which have not been indexed yet, and adds
+        their terms to ``postings``.
+
+        """
+        path = log.path
+        if path is None:
+            return 0
+        size_key = "s" + log.channel.encode_element_key(log.date)
+        indexed = int(database[size_key]) if database.has_key(size_key) else 0
+        if os.path.getsize(path) < indexed:
+            self._remove_date(database, log.date.toordinal())
+            indexed = 0
+        encoding = log.encoding
+        ordinal = log.date.toordinal()
+        count = 0
+        with open(path, "rb") as file:
+            lines = irclog.parser.OffsetLines(file, encoding, indexed)
+            messages = irclog.parser.parse(lines, log.date, encoding,
+                                           kinds=INDEXED_MESSAGE_TYPES)
+            for message in messages:
+                if isinstance(message, irclog.messages.Message):
+                    keys = ["t" + term.encode("utf-8")
+                            for term in split_terms(message.line)]
+                else:
+                    keys = []
+                keys.extend(set("n" + nick.lower().encode("utf-8")
+                                for nick in message_nicks(message)))
+                for key in keys:
+                    try:
+                        posting = postings[key, ordinal]
+                    except KeyError:
+                        posting = postings[key, ordinal] = array.array("I")
+                    posting.append(lines.offset)
+                if keys:
+                    count += 1
+        database[size_key] = str(lines.end)
+        return count
+
+    def _write(self, database, postings):
+        """Writes ``postings`` of ``(key, date_ordinal)`` pairs to offsets.
+        The offsets are appended to the key of the date, and only dates new
+        to a key are added to its list of dates.
+
+        """
+        new_dates = {}
+        for (key, ordinal), posting in postings.iteritems():
+            date_key = _date_key(key, ordinal)
+            data = posting.tostring()
+            if database.has_key(date_key):
+                data = database[date_key] + data
+            else:
+                new_dates.setdefault(key, []).append(ordinal)
+            database[date_key] = data
+        for key, ordinals in new_dates.iteritems():
+            dates = self._posting(database, key)
+            dates.extend(ordinals)
+            database[key] = array.array("I", sorted(set(dates))).tostring()
+        if hasattr(database, "sync"):
+            database.sync()
+
+    def _remove_date(self, database, ordinal):
+        suffix = _date_key("", ordinal)
+        for date_key in database.keys():
+            if date_key[:1] in ("t", "n") and date_key.endswith(suffix):
+                del database[date_key]
+                key = date_key[:-len(suffix)]
+                dates = self._posting(database, key)
+                dates.remove(ordinal)
+                if dates:
+                    database[key] = dates.tostring()
+                else:
+                    del database[key]
+
+    def search(self, channel, query):
+        """Finds lines of ``channel`` which contain all terms of ``query``.
+
+        :param channel: a channel to search
+        :type channel: :class:`irclog.archive.Channel`
+        :param query: terms to find
+        :type query: :class:`unicode`
+        :returns: a sorted :class:`list` of ``(date_ordinal, offset)`` pairs
+
+        """
+        terms = split_terms(query)
+        if not terms:
+            return []
+        database = self.database(channel)
+        if database is None:
+            return []
+        keys = ["t" + term.encode("utf-8") for term in terms]
+        dates = None
+        for key in keys:
+            key_dates = set(self._posting(database, key))
+            dates = key_dates if dates is None else dates & key_dates
+            if not dates:
+                return []
+        found = []
+        for ordinal in sorted(dates):
+            offsets = None
+            for key in keys:
+                posting = self._posting(database, _date_key(key, ordinal))
+                offsets = (set(posting) if offsets is None
+                           else offsets.intersection(posting))
+                if not offsets:
+                    break
+            found.extend((ordinal, offset) for offset in sorted(offsets))
+        return found
+
+    def _posting(self, database, key):
+        posting = array.array("I")
+        if database.has_key(key):
+            posting.fromstring(database[key])
+        return posting
+
+    def nick_history(self, channel, nick):
+        r"""Finds lines of ``channel`` which ``nick`` has made. Nicks are
+        case-insensitive. Parts count, and so do both nicks of a nick
+        change, but unsetting the topic does not:
+
+        .. sourcecode:: pycon
+
+           >>> import shutil, tempfile, irclog.archive
+           >>> root = tempfile.mkdtemp()
+           >>> os.makedirs(os.path.join(root, "logs", "srv"))
+           >>> with open(os.path.join(root, "logs", "srv",
+           ...                        "#a.2010-08-04.log"), "w") as file:
+           ...     file.write("10:00 <hong> hi\n"
+           ...                "10:01 -!- Topic unset by hong on #a\n"
+           ...                "10:02 -!- hong [~hong@example.com] "
+           ...                "has left #a [bye/]\n"
+           ...                "10:03 -!- DrSlem is now known as Hong\n")
+           >>> archive = irclog.archive.Archive(
+           ...     root + "/logs/<server>/<channel>.<date:%Y-%m-%d>.log",
+           ...     encoding="utf-8",
+           ...     search_index_path=os.path.join(root, "index")
+           ... )
+           >>> archive.search_index.update_archive(archive)
+           3
+           >>> channel = archive["srv"]["#a"]
+           >>> [int(offset) for _, offset
+           ...  in archive.search_index.nick_history(channel, u"HONG")]
+           [0, 52, 106]
+           >>> [type(message).__name__ for _, message
+           ...  in channel.nick_history(u"hong")]
+           ['PublicMessage', 'PartMessage', 'NickMessage']
+           >>> archive.search_index.nick_history(channel, u"nobody")
+           []
+           >>> archive.search_index.close()
+           >>> shutil.rmtree(root)
+
+        :param channel: a channel to search
+        :type channel: :class:`irclog.archive.Channel`
+        :param nick: a nick
+        :type nick: :class:`unicode`
+        :returns: a sorted :class:`list` of ``(date_ordinal, offset)`` pairs
+
+        """
+        database = self.database(channel)
+        if database is None:
+            return []
+        key = "n" + nick.lower().encode("utf-8")
+        found = []
+        for ordinal in self._posting(database, key):
+            posting = self._posting(database, _date_key(key, ordinal))
+            found.extend((ordinal, offset) for offset in sorted(posting))
+        return found
+
+    def close(self):
+        """Closes all opened databases."""
+        for database, _, _ in self._databases.itervalues():
+            database.close()
+        self._databases.clear()
+
+    def __repr__(self):
+        t = type(self)
+        mod = "" if t.__module__ == "__main__" else t.__module__ + "."
+        return "{0}{1}({2!r})".format(mod, t.__name__, self.path)
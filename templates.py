@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Precompiled templates of the comic page.
+
+Templates are compiled once when this module is imported: each ``{name}``
+field is turned into a ``%s`` slot, so rendering is a single ``%`` of the
+values and no template text is parsed while a request is served.
+
+Rendered panels are kept in a :class:`FragmentCache` by the hash of their
+content, so a panel which has been rendered once is not rendered again.
+"""
+import re
+import hashlib
+import collections
+
+
+FIELD_RE = re.compile(r"\{(\w+)\}")
+
+
+class Template(object):
+	"""A compiled template. Fields are written as ``{name}``."""
+
+	__slots__ = "source", "names", "_format"
+
+	def __init__(self, source):
+		self.source = source
+		parts = FIELD_RE.split(source)
+		self.names = tuple(parts[1::2])
+		literals = [part.replace(u"%", u"%%") for part in parts[0::2]]
+		self._format = u"%s".join(literals)
+
+	def render(self, **values):
+		return self._format % tuple(values[name] for name in self.names)
+
+	def __repr__(self):
+		return "%s.%s(%r)" % (type(self).__module__, type(self).__name__, self.source)
+
+
+class FragmentCache(object):
+	"""The least recently used cache of rendered fragments, keyed by the hash
+	of their content."""
+
+	CAPACITY = 4096
+
+	__slots__ = "capacity", "_fragments"
+
+	def __init__(self, capacity=CAPACITY):
+		self.capacity = capacity
+		self._fragments = collections.OrderedDict()
+
+	@staticmethod
+	def key(*parts):
+		digest = hashlib.md5()
+		for part in parts:
+			digest.update(part.encode("utf-8"))
+			digest.update("\0")
+		return digest.digest()
+
+	def get(self, key, render):
+		"""Returns the fragment of ``key``, and renders it with ``render()``
+		if it is not cached."""
+		try:
+			fragment = self._fragments.pop(key)
+		except KeyError:
+			fragment = render()
+			if len(self._fragments) >= self.capacity:
+				self._fragments.popitem(last=False)
+		self._fragments[key] = fragment
+		return fragment
+
+	def __contains__(self, key):
+		return key in self._fragments
+
+	def __len__(self):
+		return len(self._fragments)
+
+
+PAGE_HEAD = Template(u"""<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN"
+    "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en">
+<head>
+<meta http-equiv="Content-Type" content="text/html;charset={charset}" />
+<title>{title}</title>
+</head>
+<body>
+""")
+#<link rel="stylesheet" type="text/css" media="screen" href=""http://toppe.no/~joink/rageit/style-screen.css">
+
+STRIP_HEAD = Template(u"""<p>strip_length = {strip_length}, grid_width = {grid_width}, grid_length = {grid_length}</p>
+<table border="1">
+""")
+
+ROW_HEAD = Template(u"<tr>\n")
+
+ROW_TAIL = Template(u"</tr>\n")
+
+PANEL = Template(u"""<td>
+<p>{speak}</p>
+<img src="{avatar}">
+<p>{nick}</p>
+<p>{debug}</p>
+</td>
+""")
+
+EMPTY_PANEL = Template(u"<td>\n</td>\n")
+
+STRIP_TAIL = Template(u"</table>\n")
+
+PAGE_TAIL = Template(u"</body>\n</html>\n")